@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db import DatabaseError
 
 
 class TreeApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tree_api'
+
+    def ready(self):
+        # Connect the change log receivers.
+        from . import changelog  # noqa: F401
+        from .index import get_index
+
+        try:
+            # Load the in-memory index up front, so the first read does not pay for it.
+            get_index()
+        except DatabaseError:
+            # The tables do not exist yet, e.g. before `migrate`.
+            pass
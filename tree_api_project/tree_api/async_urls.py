@@ -0,0 +1,50 @@
+from django.urls import path
+from .async_views import (
+    get_subtree,
+    get_ancestors,
+    search_nodes,
+    get_changes,
+    get_subtree_cache_stats,
+    add_node,
+    add_subtree,
+    create_subnode,
+    reset_tree,
+    change_node_value,
+    move_node,
+    restore_deleted_node,
+    delete_node,
+    purge_deleted_nodes,
+)
+
+urlpatterns = [
+    path("get-subtree/<int:node_id>/", get_subtree, name="async-get-subtree"),
+    path("get-ancestors/<int:node_id>/", get_ancestors, name="async-get-ancestors"),
+    path("search/", search_nodes, name="async-search-nodes"),
+    path("changes/", get_changes, name="async-changes"),
+    path(
+        "subtree-cache-stats/",
+        get_subtree_cache_stats,
+        name="async-subtree-cache-stats",
+    ),
+    path("add-node/", add_node, name="async-add-node"),
+    path(
+        "create-subnode/<int:node_parent_id>/",
+        create_subnode,
+        name="async-create-subnode",
+    ),
+    path("add-subtree/<int:node_parent_id>/", add_subtree, name="async-add-subtree"),
+    path("reset-tree/", reset_tree, name="async-reset-tree"),
+    path(
+        "change-node-value/<int:node_id>/",
+        change_node_value,
+        name="async-change-node-value",
+    ),
+    path("move-node/<int:node_id>/", move_node, name="async-move-node"),
+    path(
+        "restore-deleted-node/<int:node_id>/",
+        restore_deleted_node,
+        name="async-restore-deleted-node",
+    ),
+    path("delete-node/<int:node_id>/", delete_node, name="async-delete-node"),
+    path("purge-deleted/", purge_deleted_nodes, name="async-purge-deleted"),
+]
@@ -0,0 +1,182 @@
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse
+from rest_framework import status
+
+from . import views
+from .cache import aget_cached_subtree
+from .index import index_enabled
+from .models import Tree
+from .utils import (
+    aload_ancestors,
+    aload_search_page,
+    aload_subtree,
+    aload_subtree_page,
+    etag_matches,
+    query_flag,
+    query_int,
+    subtree_etag,
+    tree_json_response,
+)
+
+# Native async versions of the tree endpoints, for ASGI deployments. They are routed under
+# `api/async/` with the same names prefixed by `async-`, next to the sync endpoints.
+
+
+async def get_subtree(request, node_id):
+    """
+    The `get_subtree` function is the async version of `views.get_subtree`. The node and the subtree, full
+    or paged, are read with the async ORM, so a slow read does not hold a thread while it waits on the
+    database. It takes the same `include_deleted`, `max_depth`, `children_limit` and `after` parameters,
+    shares the same cache and ETags, and always returns nested JSON: `?stream=` and `?format=` are only
+    available on the sync endpoint.
+    :param request: The `request` parameter represents the HTTP request object that contains information
+    about the current request, such as headers, body, and user information
+    :param node_id: The `node_id` parameter represents the unique identifier of the node that needs to
+    be retrieved from the tree structure
+    :return: a JsonResponse object with a status code of 200 (OK) if the subtree is successfully retrieved.
+    If the node does not exist, a JsonResponse object with a status code of 404 (NOT FOUND) is returned.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
+    try:
+        max_depth = query_int(request, "max_depth")
+        children_limit = query_int(request, "children_limit", minimum=1)
+        after = query_int(request, "after")
+    except ValidationError as error:
+        return JsonResponse(
+            {"error": error.messages}, status=status.HTTP_400_BAD_REQUEST
+        )
+    include_deleted = query_flag(request, "include_deleted", default=True)
+
+    if index_enabled() and not views.INDEX_BYPASS_PARAMS.intersection(request.GET):
+        return await sync_to_async(views.get_subtree_from_index)(request, node_id)
+
+    try:
+        node = await Tree.objects.aget(pk=node_id)
+    except Tree.DoesNotExist:
+        return JsonResponse(
+            {"error": "Node not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+    if node.deleted and not include_deleted:
+        return JsonResponse(
+            {"error": "Node not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    etag = subtree_etag(request, node.id, node.revision)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    if (
+        max_depth is not None
+        or children_limit is not None
+        or after is not None
+        or not include_deleted
+    ):
+        variant = f"{max_depth}.{children_limit}.{after}"
+        loader = partial(
+            aload_subtree_page, node, max_depth, children_limit, after, include_deleted
+        )
+    else:
+        variant = ""
+        loader = partial(aload_subtree, node)
+
+    subtree, cached = await aget_cached_subtree(
+        node, loader, include_deleted=include_deleted, variant=variant
+    )
+    return views.subtree_response(request, subtree, etag, "HIT" if cached else "MISS")
+
+
+async def get_ancestors(request, node_id):
+    """
+    The `get_ancestors` function is the async version of `views.get_ancestors`. The node and its chain of
+    ancestors are read with the async ORM, in the same two queries, and it takes the same `siblings`
+    parameter.
+    :param request: The `request` parameter represents the HTTP request object that contains information
+    about the current request, such as headers, body, and user information
+    :param node_id: The `node_id` parameter represents the unique identifier of the node at the bottom
+    of the chain
+    :return: a JsonResponse object with a status code of 200 (OK) and the chain in `ancestors`, the root
+    first and the node last. If the node does not exist, a JsonResponse object with a status code of 404
+    (NOT FOUND) is returned.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
+    try:
+        node = await Tree.objects.aget(pk=node_id)
+    except Tree.DoesNotExist:
+        return JsonResponse(
+            {"error": "Node not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    chain = await aload_ancestors(node, siblings=query_flag(request, "siblings"))
+    return tree_json_response({"ancestors": chain}, status=status.HTTP_200_OK)
+
+
+async def search_nodes(request):
+    """
+    The `search_nodes` function is the async version of `views.search_nodes`. The page of matching nodes and
+    their ancestors are read with the async ORM, in the same queries, and it takes the same parameters.
+    :param request: The `request` parameter represents the HTTP request object that contains information
+    about the current request, such as headers, body, and user information
+    :return: a JsonResponse object with a status code of 200 (OK), with the matching nodes in `results`
+    and the cursor of the next page in `next`. If a parameter is not valid, a JsonResponse object with
+    a status code of 400 (BAD REQUEST) is returned, and if the `under` node does not exist one with a
+    status code of 404 (NOT FOUND).
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
+    try:
+        nodes, under, limit, after = views.search_query(request)
+    except ValidationError as error:
+        return JsonResponse(
+            {"error": error.messages}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if under is not None:
+        try:
+            scope = await Tree.objects.aget(pk=under)
+        except Tree.DoesNotExist:
+            return JsonResponse(
+                {"error": "Node not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        nodes = nodes.descendants_of(scope)
+
+    page = await aload_search_page(nodes, limit, after)
+    return tree_json_response(page, status=status.HTTP_200_OK)
+
+
+def async_view(view):
+    """
+    The function `async_view` exposes a sync DRF view as a coroutine function. The view, with the atomic
+    block it runs its writes in, is executed by `sync_to_async` in the thread that owns the database
+    connection, so it never blocks the event loop.
+    :param view: The `view` parameter is the sync view function to wrap
+    :return: the async view function
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(view)(request, *args, **kwargs)
+
+    return wrapper
+
+
+get_changes = async_view(views.get_changes)
+get_subtree_cache_stats = async_view(views.get_subtree_cache_stats)
+add_node = async_view(views.add_node)
+create_subnode = async_view(views.create_subnode)
+add_subtree = async_view(views.add_subtree)
+reset_tree = async_view(views.reset_tree)
+change_node_value = async_view(views.change_node_value)
+move_node = async_view(views.move_node)
+restore_deleted_node = async_view(views.restore_deleted_node)
+delete_node = async_view(views.delete_node)
+purge_deleted_nodes = async_view(views.purge_deleted_nodes)
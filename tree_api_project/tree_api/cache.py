@@ -0,0 +1,137 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+# Cached subtrees are never invalidated in place. Instead every entry is keyed by the
+# `revision` of the node at the top of the subtree, which is stored in the database and
+# bumped by every write inside the subtree: a write bumps the node and all its ancestors,
+# and a cascading delete or restore the whole subtree as well, see `TreeQuerySet.touch`.
+# Node ids are never reused, so a replaced tree cannot hit the entries of the old one.
+#
+# Every worker thus reads the same key for the same rows, and stale entries are simply
+# never read again and age out of the cache through its TTL and LRU culling.
+KEY_PREFIX = "tree"
+
+
+def get_cache():
+    return caches[getattr(settings, "TREE_API_CACHE_ALIAS", "default")]
+
+
+def _counter_key(name):
+    return f"{KEY_PREFIX}:{name}"
+
+
+def _record(outcome):
+    cache = get_cache()
+    key = _counter_key(f"stats:{outcome}")
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def subtree_cache_key(node, include_deleted=True, variant=""):
+    """
+    The function `subtree_cache_key` builds the cache key of the subtree of `node` from its current
+    `revision`, without any cache or database access.
+
+    :param node: The `node` parameter is the `Tree` instance at the top of the subtree
+    :param include_deleted: The `include_deleted` parameter tells whether deleted nodes are part of the
+    cached subtree
+    :param variant: The `variant` parameter tells apart other representations of the same subtree, such
+    as a depth-limited page
+    :return: the cache key of the subtree
+    """
+    return (
+        f"{KEY_PREFIX}:subtree:{node.id}:{node.revision}:"
+        f"{int(include_deleted)}:{variant}"
+    )
+
+
+def peek_cached_subtree(node, include_deleted=True, variant=""):
+    """
+    The function `peek_cached_subtree` returns the subtree of `node` from the cache, counting a hit,
+    or None without building it on a miss.
+
+    :param node: The `node` parameter is the `Tree` instance at the top of the subtree
+    :param include_deleted: The `include_deleted` parameter tells whether deleted nodes are part of the
+    subtree
+    :param variant: The `variant` parameter tells apart other representations of the same subtree
+    :return: the cached subtree, or None
+    """
+    subtree = get_cache().get(subtree_cache_key(node, include_deleted, variant))
+    if subtree is not None:
+        _record("hits")
+    return subtree
+
+
+def get_cached_subtree(node, loader, include_deleted=True, variant=""):
+    """
+    The function `get_cached_subtree` returns the subtree of `node` from the cache, or builds it with
+    `loader` and caches it on a miss.
+
+    :param node: The `node` parameter is the `Tree` instance at the top of the subtree
+    :param loader: The `loader` parameter is a callable that builds the subtree from the database
+    :param include_deleted: The `include_deleted` parameter tells whether deleted nodes are part of the
+    subtree
+    :param variant: The `variant` parameter tells apart other representations of the same subtree
+    :return: a tuple with the subtree and True if it was served from the cache
+    """
+    subtree = peek_cached_subtree(node, include_deleted, variant)
+    if subtree is not None:
+        return subtree, True
+
+    _record("misses")
+    subtree = loader()
+    get_cache().set(
+        subtree_cache_key(node, include_deleted, variant),
+        subtree,
+        timeout=getattr(settings, "TREE_API_CACHE_TIMEOUT", 300),
+    )
+    return subtree, False
+
+
+async def aget_cached_subtree(node, loader, include_deleted=True, variant=""):
+    """
+    The function `aget_cached_subtree` is the async version of `get_cached_subtree`, for a `loader`
+    that is a coroutine function.
+
+    :param node: The `node` parameter is the `Tree` instance at the top of the subtree
+    :param loader: The `loader` parameter is a coroutine function that builds the subtree
+    :param include_deleted: The `include_deleted` parameter tells whether deleted nodes are part of the
+    subtree
+    :param variant: The `variant` parameter tells apart other representations of the same subtree
+    :return: a tuple with the subtree and True if it was served from the cache
+    """
+    cache = get_cache()
+    key = subtree_cache_key(node, include_deleted, variant)
+    subtree = await cache.aget(key)
+    if subtree is not None:
+        await sync_to_async(_record)("hits")
+        return subtree, True
+
+    await sync_to_async(_record)("misses")
+    subtree = await loader()
+    await cache.aset(
+        key, subtree, timeout=getattr(settings, "TREE_API_CACHE_TIMEOUT", 300)
+    )
+    return subtree, False
+
+
+def subtree_cache_stats():
+    """
+    The function `subtree_cache_stats` returns the hit and miss counters of the subtree cache.
+
+    :return: a dict with the `hits`, `misses` and `hit_rate` of the subtree cache
+    """
+    counters = get_cache().get_many(
+        [_counter_key("stats:hits"), _counter_key("stats:misses")]
+    )
+    hits = counters.get(_counter_key("stats:hits"), 0)
+    misses = counters.get(_counter_key("stats:misses"), 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total else None,
+    }
@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Tree, TreeChange
+from .signals import tree_changed
+
+# The retention is enforced once every this many entries, after the write commits.
+PRUNE_INTERVAL = 100
+
+
+def change_log_enabled():
+    return getattr(settings, "TREE_API_CHANGE_LOG", False)
+
+
+def _node_row(node):
+    return [node.id, node.value, node.deleted, node.parent_id]
+
+
+def prune_changes():
+    """
+    The function `prune_changes` deletes the oldest entries of the change log, keeping the last
+    `TREE_API_CHANGE_LOG_RETENTION` ones, with a single DELETE.
+
+    :return: the number of deleted entries
+    """
+    retention = getattr(settings, "TREE_API_CHANGE_LOG_RETENTION", 10_000)
+    latest = TreeChange.objects.order_by("-id").values_list("id", flat=True).first()
+    if latest is None or latest <= retention:
+        return 0
+    deleted, _ = TreeChange.objects.filter(id__lte=latest - retention).delete()
+    return deleted
+
+
+def record_change(action, node_id=None, **data):
+    """
+    Append one entry to the change log, in the transaction of the write it describes, so the log
+    never holds a write that was rolled back nor misses one that was committed.
+    """
+    if not change_log_enabled():
+        return
+    change = TreeChange.objects.create(action=action, node_id=node_id, data=data)
+    if change.id % PRUNE_INTERVAL == 0:
+        transaction.on_commit(prune_changes)
+
+
+def load_changes(since, limit):
+    """
+    The function `load_changes` returns the entries of the change log written after the `since`
+    cursor, oldest first.
+
+    :param since: The `since` parameter is the id of the last entry the client applied
+    :param limit: The `limit` parameter is the maximum number of entries returned
+    :return: a tuple with the list of serialized entries, and whether more entries follow them
+    """
+    rows = list(
+        TreeChange.objects.filter(id__gt=since)
+        .order_by("id")
+        .values_list("id", "action", "node_id", "data")[: limit + 1]
+    )
+    changes = [
+        {"id": change_id, "action": action, "node": node_id, **data}
+        for change_id, action, node_id, data in rows[:limit]
+    ]
+    return changes, len(rows) > limit
+
+
+@receiver(post_save, sender=Tree, dispatch_uid="tree_change_log_post_save")
+def log_saved_node(sender, instance, created, **kwargs):
+    # New values and moves alike, the row holds the current value and parent.
+    record_change(
+        "create" if created else "update", instance.id, nodes=[_node_row(instance)]
+    )
+
+
+@receiver(post_delete, sender=Tree, dispatch_uid="tree_change_log_post_delete")
+def log_deleted_node(sender, instance, **kwargs):
+    record_change("delete", instance.id)
+
+
+@receiver(tree_changed, sender=Tree, dispatch_uid="tree_change_log_tree_changed")
+def log_changed_tree(sender, action, **kwargs):
+    if not change_log_enabled():
+        return
+    if action == "create":
+        nodes = kwargs["nodes"]
+        if not nodes:
+            return
+        record_change(
+            "create", nodes[0].parent_id, nodes=[_node_row(node) for node in nodes]
+        )
+    elif action in ("soft_delete", "restore"):
+        record_change(action, kwargs["node"].id, cascade=kwargs["cascade"])
+    elif action == "purge":
+        record_change("purge", node_ids=kwargs["node_ids"])
+    else:
+        record_change(action)
@@ -0,0 +1,339 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Tree, TreeGeneration
+from .signals import tree_changed
+
+NO_SLOT = -1
+# Parent slot of a node that was deleted from the table after the index was built.
+REMOVED = -2
+
+
+class TreeIndex:
+    """
+    A compact in-memory copy of the `Tree` table, used to serve subtrees without any query.
+
+    Every node lives in a slot of a few parallel `array`s: its id, its parent slot, its first
+    child and next sibling slots, plus its value and deleted flag. Slots are allocated in
+    increasing id order, so `ids` stays sorted and a node is found with a binary search instead
+    of a per-node dict, and sibling lists are kept in id order like the database reads.
+    """
+
+    __slots__ = (
+        "ids",
+        "parents",
+        "first_child",
+        "next_sibling",
+        "values",
+        "deleted",
+        "generation",
+        "stale",
+    )
+
+    def __init__(self, generation=0):
+        self.ids = array("q")
+        self.parents = array("q")
+        self.first_child = array("q")
+        self.next_sibling = array("q")
+        self.values = []
+        self.deleted = bytearray()
+        self.generation = generation
+        self.stale = False
+
+    @classmethod
+    def build(cls, generation):
+        """
+        Load the whole table with a single ordered query.
+        """
+        index = cls(generation)
+        parent_ids = array("q")
+        rows = (
+            Tree.objects.order_by("id")
+            .values_list("id", "parent_id", "value", "deleted")
+            .iterator(chunk_size=5000)
+        )
+        for node_id, parent_id, value, deleted in rows:
+            index.ids.append(node_id)
+            parent_ids.append(parent_id or 0)
+            index.values.append(value)
+            index.deleted.append(deleted)
+
+        size = len(index.ids)
+        index.parents = array("q", [NO_SLOT]) * size
+        index.first_child = array("q", [NO_SLOT]) * size
+        index.next_sibling = array("q", [NO_SLOT]) * size
+        last_child = array("q", [NO_SLOT]) * size
+        for slot, parent_id in enumerate(parent_ids):
+            parent = index.slot(parent_id) if parent_id else None
+            if parent is None:
+                continue
+            index.parents[slot] = parent
+            if last_child[parent] == NO_SLOT:
+                index.first_child[parent] = slot
+            else:
+                index.next_sibling[last_child[parent]] = slot
+            last_child[parent] = slot
+        return index
+
+    def slot(self, node_id):
+        slot = bisect_left(self.ids, node_id)
+        if (
+            slot < len(self.ids)
+            and self.ids[slot] == node_id
+            and self.parents[slot] != REMOVED
+        ):
+            return slot
+        return None
+
+    def _node(self, slot):
+        parent = self.parents[slot]
+        return {
+            "id": self.ids[slot],
+            "value": self.values[slot],
+            "deleted": bool(self.deleted[slot]),
+            "parent": self.ids[parent] if parent >= 0 else None,
+            "children": [],
+        }
+
+    def _descendant_slots(self, slot):
+        pending = [slot]
+        while pending:
+            slot = pending.pop()
+            yield slot
+            child = self.first_child[slot]
+            while child != NO_SLOT:
+                pending.append(child)
+                child = self.next_sibling[child]
+
+    def subtree(self, node_id, include_deleted=True):
+        """
+        Return the subtree of `node_id` in the same shape as `load_subtree`, or None when the
+        node does not exist. Without `include_deleted`, deleted branches are skipped.
+        """
+        slot = self.slot(node_id)
+        if slot is None or (self.deleted[slot] and not include_deleted):
+            return None
+
+        root = self._node(slot)
+        pending = [(slot, root)]
+        while pending:
+            slot, data = pending.pop()
+            child = self.first_child[slot]
+            while child != NO_SLOT:
+                if include_deleted or not self.deleted[child]:
+                    child_data = self._node(child)
+                    data["children"].append(child_data)
+                    pending.append((child, child_data))
+                child = self.next_sibling[child]
+        return root
+
+    def _link(self, slot, parent):
+        self.parents[slot] = parent
+        if parent == NO_SLOT:
+            return
+        previous, child = NO_SLOT, self.first_child[parent]
+        while child != NO_SLOT and self.ids[child] < self.ids[slot]:
+            previous, child = child, self.next_sibling[child]
+        self.next_sibling[slot] = child
+        if previous == NO_SLOT:
+            self.first_child[parent] = slot
+        else:
+            self.next_sibling[previous] = slot
+
+    def _unlink(self, slot):
+        parent = self.parents[slot]
+        if parent < 0:
+            return
+        previous, child = NO_SLOT, self.first_child[parent]
+        while child != slot:
+            previous, child = child, self.next_sibling[child]
+        if previous == NO_SLOT:
+            self.first_child[parent] = self.next_sibling[slot]
+        else:
+            self.next_sibling[previous] = self.next_sibling[slot]
+        self.next_sibling[slot] = NO_SLOT
+
+    def _parent_slot(self, parent_id):
+        if parent_id is None:
+            return NO_SLOT
+        parent = self.slot(parent_id)
+        if parent is None:
+            raise KeyError(parent_id)
+        return parent
+
+    def upsert(self, node_id, parent_id, value, deleted):
+        slot = self.slot(node_id)
+        if slot is None:
+            if self.ids and node_id <= self.ids[-1]:
+                # Ids committed out of order, only a rebuild can place it.
+                raise KeyError(node_id)
+            slot = len(self.ids)
+            self.ids.append(node_id)
+            self.parents.append(NO_SLOT)
+            self.first_child.append(NO_SLOT)
+            self.next_sibling.append(NO_SLOT)
+            self.values.append(value)
+            self.deleted.append(deleted)
+            self._link(slot, self._parent_slot(parent_id))
+            return
+
+        self.values[slot] = value
+        self.deleted[slot] = deleted
+        parent = self._parent_slot(parent_id)
+        if parent != self.parents[slot]:
+            self._unlink(slot)
+            self._link(slot, parent)
+
+    def upsert_many(self, rows):
+        for row in rows:
+            self.upsert(*row)
+
+    def remove(self, node_id):
+        slot = self.slot(node_id)
+        if slot is None:
+            return
+        self._unlink(slot)
+        self.parents[slot] = REMOVED
+
+    def remove_many(self, node_ids):
+        for node_id in node_ids:
+            self.remove(node_id)
+
+    def set_deleted(self, node_id, deleted, cascade):
+        slot = self.slot(node_id)
+        if slot is None:
+            raise KeyError(node_id)
+        for slot in self._descendant_slots(slot) if cascade else [slot]:
+            self.deleted[slot] = deleted
+
+    def clear(self):
+        self.__init__(self.generation)
+
+    def mark_stale(self):
+        self.stale = True
+
+
+_index = None
+_checked_at = 0.0
+_lock = threading.RLock()
+
+
+def index_enabled():
+    return getattr(settings, "TREE_API_IN_MEMORY_INDEX", False)
+
+
+def get_index():
+    """
+    The function `get_index` returns the in-memory tree index, or None when it is disabled.
+
+    The index is rebuilt when the generation counter in the database shows that another worker
+    wrote to the tree. That counter is read at most once every `TREE_API_INDEX_CHECK_INTERVAL`
+    seconds, so most reads do not run any query.
+
+    :return: the current `TreeIndex`, or None
+    """
+    global _index, _checked_at
+    if not index_enabled():
+        return None
+
+    interval = getattr(settings, "TREE_API_INDEX_CHECK_INTERVAL", 1.0)
+    index = _index
+    if (
+        index is not None
+        and not index.stale
+        and time.monotonic() - _checked_at < interval
+    ):
+        return index
+
+    with _lock:
+        generation = TreeGeneration.current()
+        if _index is None or _index.stale or _index.generation != generation:
+            _index = TreeIndex.build(generation)
+        _checked_at = time.monotonic()
+        return _index
+
+
+def get_indexed_subtree(node_id, include_deleted=True):
+    """
+    The function `get_indexed_subtree` returns the subtree of `node_id` from the in-memory index.
+
+    :param node_id: The `node_id` parameter is the id of the node at the top of the subtree
+    :param include_deleted: The `include_deleted` parameter tells whether deleted branches are
+    returned
+    :return: a tuple with the subtree, or None when the node does not exist, and the generation of
+    the index it was read from
+    """
+    index = get_index()
+    with _lock:
+        return index.subtree(node_id, include_deleted), index.generation
+
+
+def _apply(method, *args):
+    """
+    Bump the generation counter in the transaction of the write, so the other workers rebuild
+    their index whenever the write is committed, and apply the write to the index of this worker
+    once it is committed.
+    """
+    if not index_enabled():
+        return
+
+    generation = TreeGeneration.bump()
+
+    def apply():
+        with _lock:
+            index = _index
+            if index is None:
+                return
+            if generation != index.generation + 1:
+                # Another worker wrote in between, this index is missing its writes.
+                index.stale = True
+                return
+            try:
+                getattr(index, method)(*args)
+            except KeyError:
+                index.stale = True
+                return
+            index.generation = generation
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Tree, dispatch_uid="tree_index_post_save")
+def index_saved_node(sender, instance, **kwargs):
+    _apply("upsert", instance.id, instance.parent_id, instance.value, instance.deleted)
+
+
+@receiver(post_delete, sender=Tree, dispatch_uid="tree_index_post_delete")
+def index_deleted_node(sender, instance, **kwargs):
+    _apply("remove", instance.id)
+
+
+@receiver(tree_changed, sender=Tree, dispatch_uid="tree_index_tree_changed")
+def index_changed_tree(sender, action, **kwargs):
+    if action == "create":
+        rows = [
+            (node.id, node.parent_id, node.value, node.deleted)
+            for node in kwargs["nodes"]
+        ]
+        _apply("upsert_many", rows)
+    elif action in ("soft_delete", "restore"):
+        _apply(
+            "set_deleted",
+            kwargs["node"].id,
+            action == "soft_delete",
+            kwargs["cascade"],
+        )
+    elif action == "purge":
+        _apply("remove_many", kwargs["node_ids"])
+    elif action == "clear":
+        _apply("clear")
+    else:
+        # Writes the index does not know how to replay are picked up by a rebuild.
+        _apply("mark_stale")
@@ -0,0 +1,310 @@
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import reverse
+
+from tree_api import urls
+from tree_api.cache import get_cache
+from tree_api.models import Tree
+from tree_api.utils import fanout_for_size, generate_tree
+
+DEFAULT_SIZES = [10, 1000, 10000]
+
+
+def _percentile(values, percent):
+    # Nearest-rank percentile of sorted values.
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def _random_node(rng, deleted=False):
+    """
+    Pick a random node below the root, deleted or not.
+    """
+    nodes = Tree.objects.filter(deleted=deleted, depth__gt=0).order_by("id")
+    bounds = Tree.objects.order_by("id").values_list("id", flat=True)
+    start = rng.randint(bounds.first(), bounds.last())
+    return nodes.filter(id__gte=start).first() or nodes.last()
+
+
+def _request(method, name, data=None, query="", **kwargs):
+    return {
+        "method": method,
+        "url": reverse(name, kwargs=kwargs or None) + query,
+        "data": data,
+    }
+
+
+def benchmark_cases(root_id, rng):
+    """
+    The benchmark cases, as (url name, case, prepare) tuples. `prepare` sets up the data of one
+    request outside of the measured time and returns its method, url and data, with an optional
+    `cleanup` callable. `reset-tree` comes last, as it replaces the generated tree.
+    """
+
+    def get_subtree(query=""):
+        return lambda: _request("get", "get-subtree", query=query, node_id=root_id)
+
+    def get_ancestors(query=""):
+        def prepare():
+            node = Tree.objects.filter(depth__gt=0).order_by("-depth", "id").first()
+            return _request("get", "get-ancestors", query=query, node_id=node.id)
+
+        return prepare
+
+    def search(query):
+        return lambda: _request("get", "search-nodes", query=query)
+
+    def create_subnode():
+        parent = Tree.objects.create(value="bench parent")
+        return _request(
+            "post",
+            "create-subnode",
+            {"value": "bench"},
+            node_parent_id=parent.id,
+        )
+
+    def add_subtree():
+        parent = Tree.objects.create(value="bench parent")
+        subtree = {"value": "bench", "children": [{"value": "a"}, {"value": "b"}]}
+        return _request("post", "add-subtree", subtree, node_parent_id=parent.id)
+
+    def change_node_value():
+        node = _random_node(rng)
+        return _request("put", "change-node-value", {"value": "bench"}, node_id=node.id)
+
+    def move_node():
+        node = _random_node(rng)
+        previous_parent = node.parent
+        parent = Tree.objects.create(value="bench parent")
+        request = _request("put", "move-node", {"parent": parent.id}, node_id=node.id)
+        request["cleanup"] = lambda: Tree.objects.move(
+            Tree.objects.get(pk=node.id), previous_parent
+        )
+        return request
+
+    def delete_node():
+        node = _random_node(rng)
+        request = _request("delete", "delete-node", node_id=node.id)
+        request["cleanup"] = lambda: Tree.objects.restore(node, cascade=True)
+        return request
+
+    def restore_deleted_node():
+        node = _random_node(rng)
+        Tree.objects.soft_delete(node)
+        return _request("put", "restore-deleted-node", node_id=node.id)
+
+    def purge_deleted():
+        # A deleted branch of a few nodes, as `generate_tree` deletes whole branches.
+        parent = Tree.objects.create(value="bench parent")
+        Tree.objects.create_subtree(
+            [{"value": "bench", "children": [{"value": "a"}, {"value": "b"}]}], parent
+        )
+        Tree.objects.soft_delete(parent)
+        return _request("post", "purge-deleted", {"older_than_days": 0})
+
+    return [
+        ("get-subtree", "full", get_subtree()),
+        ("get-subtree", "without deleted", get_subtree("?include_deleted=false")),
+        ("get-subtree", "page", get_subtree("?max_depth=2&children_limit=5")),
+        ("get-subtree", "flat", get_subtree("?format=flat")),
+        ("get-subtree", "stream", get_subtree("?stream=1")),
+        ("get-ancestors", "", get_ancestors()),
+        ("get-ancestors", "siblings", get_ancestors("?siblings=true")),
+        ("search-nodes", "exact", search("?q=node1.1&mode=exact")),
+        ("search-nodes", "prefix", search("?q=node1.&mode=prefix")),
+        ("search-nodes", "contains", search("?q=.1.1")),
+        (
+            "search-nodes",
+            "contains, scoped",
+            search(f"?q=.1.1&under={root_id}&include_deleted=false"),
+        ),
+        ("changes", "cursor", lambda: _request("get", "changes")),
+        ("changes", "", lambda: _request("get", "changes", query="?since=0")),
+        ("subtree-cache-stats", "", lambda: _request("get", "subtree-cache-stats")),
+        ("add-node", "", lambda: _request("post", "add-node", {"value": "bench"})),
+        ("create-subnode", "", create_subnode),
+        ("add-subtree", "", add_subtree),
+        ("change-node-value", "", change_node_value),
+        ("move-node", "", move_node),
+        ("delete-node", "", delete_node),
+        ("restore-deleted-node", "", restore_deleted_node),
+        ("purge-deleted", "", purge_deleted),
+        ("reset-tree", "", lambda: _request("post", "reset-tree", {})),
+    ]
+
+
+def _send(client, request):
+    data = json.dumps(request["data"]) if request["data"] is not None else None
+    kwargs = {"content_type": "application/json"} if data is not None else {}
+    started = time.perf_counter()
+    response = getattr(client, request["method"])(request["url"], data, **kwargs)
+    content = (
+        b"".join(response.streaming_content) if response.streaming else response.content
+    )
+    elapsed = time.perf_counter() - started
+    if response.status_code >= 400:
+        raise CommandError(
+            f"{request['method'].upper()} {request['url']} returned {response.status_code}."
+        )
+    return elapsed, len(content)
+
+
+def run_benchmark(sizes, iterations, deleted_ratio=0.0, seed=0, cached=False):
+    """
+    The function `run_benchmark` generates a tree of every size and runs every endpoint of
+    `tree_api/urls.py` against it through the test client, in the current database.
+
+    Every request is timed `iterations` times, with the subtree cache cleared before each one
+    unless `cached` is set. One more request is made under `tracemalloc` and
+    `CaptureQueriesContext` to count its queries and measure its peak memory, as both slow the
+    request down.
+
+    :param sizes: The `sizes` parameter is the list of tree sizes, in nodes
+    :param iterations: The `iterations` parameter is the number of timed requests per endpoint
+    :param deleted_ratio: The `deleted_ratio` parameter is the share of deleted nodes in the trees
+    :param seed: The `seed` parameter makes the trees and the picked nodes the same between runs
+    :param cached: The `cached` parameter keeps the subtree cache between requests
+    :return: a list with one dict of results per tree size and benchmark case
+    """
+    client = Client()
+    results = []
+    for size in sizes:
+        tree = generate_tree(fanout_for_size(size), size, deleted_ratio, seed)
+        rng = random.Random(seed)
+        cases = benchmark_cases(tree["root"], rng)
+
+        missing = {url.name for url in urls.urlpatterns} - {name for name, *_ in cases}
+        if missing:
+            raise CommandError(f"No benchmark case for {', '.join(sorted(missing))}.")
+
+        for name, case, prepare in cases:
+            latencies = []
+            for _ in range(iterations):
+                if not cached:
+                    get_cache().clear()
+                request = prepare()
+                elapsed, size_bytes = _send(client, request)
+                latencies.append(elapsed)
+                if "cleanup" in request:
+                    request["cleanup"]()
+
+            if not cached:
+                get_cache().clear()
+            request = prepare()
+            tracemalloc.start()
+            with CaptureQueriesContext(connection) as queries:
+                _send(client, request)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            if "cleanup" in request:
+                request["cleanup"]()
+
+            latencies.sort()
+            results.append(
+                {
+                    "size": size,
+                    "nodes": tree["nodes"],
+                    "deleted": tree["deleted"],
+                    "endpoint": name,
+                    "case": case,
+                    "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+                    "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+                    "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+                    "queries": len(queries),
+                    "peak_memory_kb": round(peak / 1024, 1),
+                    "response_bytes": size_bytes,
+                }
+            )
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Run every tree endpoint against generated trees of several sizes, in a test database, "
+        "and report latency percentiles, query counts and peak memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default=",".join(str(size) for size in DEFAULT_SIZES),
+            help="Comma separated tree sizes, in nodes.",
+        )
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--deleted-ratio", type=float, default=0.1)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--cached",
+            action="store_true",
+            help="Keep the subtree cache between requests.",
+        )
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+
+    def handle(self, sizes, iterations, deleted_ratio, seed, cached, output, **options):
+        try:
+            sizes = [int(size) for size in sizes.split(",")]
+        except ValueError:
+            raise CommandError("`--sizes` must be comma separated integers.")
+        if iterations < 1:
+            raise CommandError("`--iterations` must be at least 1.")
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        databases = runner.setup_databases()
+        try:
+            results = run_benchmark(sizes, iterations, deleted_ratio, seed, cached)
+        finally:
+            runner.teardown_databases(databases)
+            teardown_test_environment()
+
+        for result in results:
+            endpoint = result["endpoint"] + (
+                f" ({result['case']})" if result["case"] else ""
+            )
+            self.stdout.write(
+                f"{result['size']:>7} {endpoint:<32} "
+                f"p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+                f"p99 {result['p99_ms']:>9.2f} ms  {result['queries']:>4} queries  "
+                f"{result['peak_memory_kb']:>9.1f} KB  {result['response_bytes']:>9} bytes"
+            )
+
+        if output:
+            report = {
+                "commit": _git_commit(),
+                "created": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "iterations": iterations,
+                "deleted_ratio": deleted_ratio,
+                "cached": cached,
+                "results": results,
+            }
+            with open(output, "w") as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f"Results written to {output}")
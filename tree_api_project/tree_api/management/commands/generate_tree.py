@@ -0,0 +1,61 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from tree_api.models import MAX_DEPTH
+from tree_api.utils import fanout_for_size, generate_tree, parse_tree_shape
+
+
+class Command(BaseCommand):
+    help = (
+        "Replace the whole tree with a generated one, either of a given number of nodes or with "
+        "a given fan-out per level, and soft delete random branches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--nodes",
+            type=int,
+            help="Number of nodes, filled level by level with the smallest fan-out that fits.",
+        )
+        parser.add_argument(
+            "--fanout",
+            help="Children per node, a single number or one per level such as 9,3,3,3.",
+        )
+        parser.add_argument(
+            "--depth",
+            type=int,
+            help=f"Number of levels below the root, at most {MAX_DEPTH - 1}.",
+        )
+        parser.add_argument(
+            "--deleted-ratio",
+            type=float,
+            default=0.0,
+            help="Share of the nodes to mark as deleted, between 0 and 1.",
+        )
+        parser.add_argument("--seed", type=int, help="Seed of the deleted branches.")
+
+    def handle(self, nodes, fanout, depth, deleted_ratio, seed, **options):
+        try:
+            if nodes is not None:
+                if fanout is not None:
+                    raise ValidationError("Use either `--nodes` or `--fanout`.")
+                fanout = fanout_for_size(
+                    nodes, MAX_DEPTH - 1 if depth is None else depth
+                )
+            else:
+                data = {"depth": depth}
+                if fanout is not None:
+                    data["fanout"] = [int(count) for count in fanout.split(",")]
+                    if len(data["fanout"]) == 1:
+                        data["fanout"] = data["fanout"][0]
+                fanout = parse_tree_shape(data)
+            result = generate_tree(fanout, nodes, deleted_ratio, seed)
+        except (ValidationError, ValueError) as error:
+            raise CommandError(
+                " ".join(getattr(error, "messages", [str(error)]))
+            ) from error
+
+        self.stdout.write(
+            f"Generated {result['nodes']} nodes under root {result['root']}, "
+            f"{result['deleted']} deleted."
+        )
@@ -0,0 +1,58 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Send concurrent GET requests to a running server and report its throughput and "
+        "latency, to compare deployments such as WSGI and ASGI."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "url",
+            help="URL to request, such as http://127.0.0.1:8000/api/get-subtree/1/",
+        )
+        parser.add_argument("--concurrency", "-c", type=int, default=16)
+        parser.add_argument("--requests", "-n", type=int, default=1000)
+
+    def handle(self, url, concurrency, requests, **options):
+        parts = urlsplit(url)
+        if parts.scheme != "http" or not parts.hostname:
+            raise CommandError("Only http:// URLs are supported.")
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+
+        local = threading.local()
+        statuses = {}
+
+        def send(_):
+            # One keep-alive connection per worker thread.
+            if not hasattr(local, "connection"):
+                local.connection = HTTPConnection(parts.hostname, parts.port or 80)
+            started = time.perf_counter()
+            local.connection.request("GET", target)
+            response = local.connection.getresponse()
+            response.read()
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = sorted(executor.map(send, range(requests)))
+        elapsed = time.perf_counter() - started
+
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"{requests} requests, concurrency {concurrency}: "
+            f"{requests / elapsed:.1f} req/s, "
+            f"p50 {percentiles[49] * 1000:.1f} ms, "
+            f"p95 {percentiles[94] * 1000:.1f} ms, "
+            f"p99 {percentiles[98] * 1000:.1f} ms, "
+            f"statuses {dict(sorted(statuses.items()))}"
+        )
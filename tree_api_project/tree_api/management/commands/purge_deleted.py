@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from tree_api.utils import purge_age, purge_deleted
+
+
+class Command(BaseCommand):
+    help = (
+        "Hard delete the nodes soft deleted more than a number of days ago, in small batches "
+        "from the leaves upward."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=float,
+            default=getattr(settings, "TREE_API_PURGE_AFTER_DAYS", 30),
+            help="Number of days a node stays deleted before it is purged.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=getattr(settings, "TREE_API_PURGE_BATCH_SIZE", 500),
+            help="Maximum number of nodes deleted per transaction.",
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            help="Stop after this many batches, by default run until nothing is left.",
+        )
+
+    def handle(self, days, batch_size, max_batches, **options):
+        try:
+            older_than = purge_age(days, "--days")
+        except ValidationError as error:
+            raise CommandError(error.messages[0])
+        if batch_size < 1:
+            raise CommandError("`--batch-size` must be at least 1.")
+
+        result = purge_deleted(older_than, batch_size, max_batches)
+        self.stdout.write(
+            f"Purged {result['purged']} nodes in {result['batches']} batches."
+            + ("" if result["done"] else " Some nodes are left to purge.")
+        )
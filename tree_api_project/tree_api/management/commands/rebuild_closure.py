@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tree_api.models import TreeClosure
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the closure table of the tree from the parent of every node, one query per "
+        "level."
+    )
+
+    def handle(self, **options):
+        rows = TreeClosure.objects.rebuild()
+        self.stdout.write(f"Rebuilt the closure table with {rows} rows.")
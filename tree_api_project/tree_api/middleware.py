@@ -0,0 +1,172 @@
+import contextvars
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger("tree_api.timing")
+
+# Metrics of the request being timed, by name, in seconds.
+_timings = contextvars.ContextVar("tree_api_timings", default=None)
+# The `QueryRecorder` of the request being timed.
+_recorder = contextvars.ContextVar("tree_api_query_recorder", default=None)
+
+
+@contextmanager
+def timing(name):
+    """
+    Add the time spent in the block to the `name` metric of the current request, when the
+    request is timed by `RequestTimingMiddleware`.
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+
+class QueryRecorder:
+    """
+    Counts and times every query of a request, called by the `_record_query` execute wrapper.
+    """
+
+    __slots__ = ("count", "duration", "queries")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            self.queries.append((elapsed, sql))
+
+
+def _record_query(execute, sql, params, many, context):
+    # Installed once on every connection, records into the recorder of the current request.
+    # Context variables follow the request into `sync_to_async` threads, so concurrent async
+    # requests sharing a connection each count their own queries.
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def _install_query_recorder():
+    # Connections are per thread: this runs in the thread that executes the queries.
+    for connection in connections.all():
+        if _record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(_record_query)
+
+
+class RequestTimingMiddleware:
+    """
+    Measures the SQL query count, the database time, the serialization time and the response
+    size of every request, when `TREE_API_TIMING` is set.
+
+    They are sent back in a `Server-Timing` header and logged as one JSON line on the
+    `tree_api.timing` logger. A request slower than `TREE_API_TIMING_BUDGET_MS` also logs its
+    `TREE_API_TIMING_SLOW_QUERIES` slowest queries as a warning. The middleware runs natively
+    in both WSGI and ASGI deployments.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "TREE_API_TIMING", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        timings = {}
+        tokens = _recorder.set(recorder), _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            _install_query_recorder()
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(tokens[0])
+            _timings.reset(tokens[1])
+        return self.report(
+            request, response, recorder, timings, time.perf_counter() - started
+        )
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        timings = {}
+        tokens = _recorder.set(recorder), _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            # The async ORM runs its queries in the thread of `sync_to_async`.
+            await sync_to_async(_install_query_recorder)()
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(tokens[0])
+            _timings.reset(tokens[1])
+        return self.report(
+            request, response, recorder, timings, time.perf_counter() - started
+        )
+
+    def report(self, request, response, recorder, timings, total):
+        """
+        Add the `Server-Timing` header to `response` and log the metrics of `request`.
+        """
+        metrics = [
+            f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries"'
+        ]
+        metrics.extend(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+        )
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        response["Server-Timing"] = ", ".join(metrics)
+
+        record = {
+            "method": request.method,
+            "path": request.get_full_path(),
+            "status": response.status_code,
+            "queries": recorder.count,
+            "db_ms": round(recorder.duration * 1000, 3),
+            **{
+                f"{name}_ms": round(seconds * 1000, 3)
+                for name, seconds in timings.items()
+            },
+            "total_ms": round(total * 1000, 3),
+            # Streamed bodies are only written after the response leaves the middleware.
+            "response_bytes": None if response.streaming else len(response.content),
+        }
+        logger.info(json.dumps(record))
+
+        budget = getattr(settings, "TREE_API_TIMING_BUDGET_MS", None)
+        if budget is not None and total * 1000 > budget:
+            slowest = sorted(recorder.queries, key=lambda query: query[0], reverse=True)
+            limit = getattr(settings, "TREE_API_TIMING_SLOW_QUERIES", 5)
+            record["slow_queries"] = [
+                {"ms": round(elapsed * 1000, 3), "sql": sql}
+                for elapsed, sql in slowest[:limit]
+            ]
+            logger.warning(json.dumps(record))
+        return response
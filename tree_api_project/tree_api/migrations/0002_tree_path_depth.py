@@ -0,0 +1,40 @@
+# Generated by Django 4.2.4 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+
+def backfill_path_depth(apps, schema_editor):
+    Tree = apps.get_model("tree_api", "Tree")
+    prefixes = {None: ""}
+    depth = 0
+    level = list(Tree.objects.filter(parent__isnull=True))
+    while level:
+        for node in level:
+            node.path = prefixes[node.parent_id]
+            node.depth = depth
+        Tree.objects.bulk_update(level, ["path", "depth"], batch_size=500)
+
+        prefixes = {node.id: f"{node.path}{node.id:010d}/" for node in level}
+        depth += 1
+        level = list(Tree.objects.filter(parent_id__in=list(prefixes)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tree_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tree',
+            name='depth',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tree',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_path_depth, migrations.RunPython.noop),
+    ]
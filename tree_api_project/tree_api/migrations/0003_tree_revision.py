@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tree_api", "0002_tree_path_depth"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tree",
+            name="revision",
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
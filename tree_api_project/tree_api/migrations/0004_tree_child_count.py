@@ -0,0 +1,33 @@
+# Generated by Django 4.2.4 on 2026-10-18 05:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_child_count(apps, schema_editor):
+    Tree = apps.get_model("tree_api", "Tree")
+    child_counts = (
+        Tree.objects.filter(parent_id=OuterRef("pk"))
+        .order_by()
+        .values("parent_id")
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    Tree.objects.update(child_count=Coalesce(Subquery(child_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tree_api", "0003_tree_revision"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tree",
+            name="child_count",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_child_count, migrations.RunPython.noop),
+    ]
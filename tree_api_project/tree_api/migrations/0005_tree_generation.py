@@ -0,0 +1,34 @@
+# Generated by Django 4.2.4 on 2026-10-18 05:09
+
+from django.db import migrations, models
+
+
+def create_generation(apps, schema_editor):
+    TreeGeneration = apps.get_model("tree_api", "TreeGeneration")
+    TreeGeneration.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tree_api", "0004_tree_child_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TreeGeneration",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("generation", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_generation, migrations.RunPython.noop),
+    ]
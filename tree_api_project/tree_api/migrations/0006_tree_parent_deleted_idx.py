@@ -0,0 +1,19 @@
+# Generated by Django 4.2.4 on 2026-10-18 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tree_api", "0005_tree_generation"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tree",
+            index=models.Index(
+                fields=["parent", "deleted"], name="tree_parent_deleted_idx"
+            ),
+        ),
+    ]
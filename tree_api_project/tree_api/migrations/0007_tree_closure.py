@@ -0,0 +1,51 @@
+# Generated by Django 4.2.4 on 2026-10-18 05:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tree_api", "0006_tree_parent_deleted_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TreeClosure",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("depth", models.PositiveSmallIntegerField()),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="descendant_links",
+                        to="tree_api.tree",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestor_links",
+                        to="tree_api.tree",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="treeclosure",
+            constraint=models.UniqueConstraint(
+                fields=("ancestor", "descendant"), name="tree_closure_unique_pair"
+            ),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.4 on 2026-10-18 05:40
+
+import sqlite3
+
+from django.db import migrations, models
+
+TREE_TABLE = "tree_api_tree"
+VALUE_SEARCH_TABLE = "tree_api_tree_value_fts"
+
+# An external content FTS5 table: it only stores the trigram index and reads `value` back
+# from the tree table, which the triggers keep it in sync with, including the bulk inserts
+# and raw deletes of `TreeQuerySet`. SQLite drops the triggers with the table, so a later
+# migration that remakes the tree table has to create them again.
+CREATE_VALUE_SEARCH = [
+    f"CREATE VIRTUAL TABLE {VALUE_SEARCH_TABLE} USING fts5("
+    f"value, content='{TREE_TABLE}', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER {VALUE_SEARCH_TABLE}_insert AFTER INSERT ON {TREE_TABLE} BEGIN "
+    f"INSERT INTO {VALUE_SEARCH_TABLE} (rowid, value) VALUES (new.id, new.value); END",
+    f"CREATE TRIGGER {VALUE_SEARCH_TABLE}_delete AFTER DELETE ON {TREE_TABLE} BEGIN "
+    f"INSERT INTO {VALUE_SEARCH_TABLE} ({VALUE_SEARCH_TABLE}, rowid, value) "
+    f"VALUES ('delete', old.id, old.value); END",
+    f"CREATE TRIGGER {VALUE_SEARCH_TABLE}_update AFTER UPDATE OF value ON {TREE_TABLE} "
+    f"BEGIN "
+    f"INSERT INTO {VALUE_SEARCH_TABLE} ({VALUE_SEARCH_TABLE}, rowid, value) "
+    f"VALUES ('delete', old.id, old.value); "
+    f"INSERT INTO {VALUE_SEARCH_TABLE} (rowid, value) VALUES (new.id, new.value); END",
+    f"INSERT INTO {VALUE_SEARCH_TABLE} ({VALUE_SEARCH_TABLE}) VALUES ('rebuild')",
+]
+
+DROP_VALUE_SEARCH = [
+    f"DROP TRIGGER IF EXISTS {VALUE_SEARCH_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {VALUE_SEARCH_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {VALUE_SEARCH_TABLE}_update",
+    f"DROP TABLE IF EXISTS {VALUE_SEARCH_TABLE}",
+]
+
+
+def value_search_supported(connection):
+    # Other databases search substrings with a table scan, and the trigram tokenizer was
+    # added in SQLite 3.34.
+    return connection.vendor == "sqlite" and sqlite3.sqlite_version_info >= (3, 34)
+
+
+def create_value_search(apps, schema_editor):
+    if value_search_supported(schema_editor.connection):
+        for statement in CREATE_VALUE_SEARCH:
+            schema_editor.execute(statement)
+
+
+def drop_value_search(apps, schema_editor):
+    if value_search_supported(schema_editor.connection):
+        for statement in DROP_VALUE_SEARCH:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tree_api", "0007_tree_closure"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tree",
+            index=models.Index(fields=["value"], name="tree_value_idx"),
+        ),
+        migrations.RunPython(create_value_search, drop_value_search),
+    ]
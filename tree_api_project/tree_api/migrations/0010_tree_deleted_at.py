@@ -0,0 +1,30 @@
+# Generated by Django 4.2.4 on 2026-10-18 05:34
+
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+
+def stamp_deleted_nodes(apps, schema_editor):
+    # The retention period of the nodes deleted before this migration starts now.
+    Tree = apps.get_model("tree_api", "Tree")
+    Tree.objects.filter(deleted=True).update(deleted_at=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tree_api", "0009_tree_change"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tree",
+            name="deleted_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="tree",
+            index=models.Index(fields=["deleted_at"], name="tree_deleted_at_idx"),
+        ),
+        migrations.RunPython(stamp_deleted_nodes, migrations.RunPython.noop),
+    ]
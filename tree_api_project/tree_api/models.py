@@ -1,29 +1,677 @@
+import sqlite3
+from collections import deque
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Concat, Substr
+from django.utils import timezone
+
+from .signals import tree_changed
+
+# Every ancestor id is stored zero-padded to this width, followed by "/", so that
+# lexical order on `path` matches tree order and prefixes never collide.
+PATH_SEGMENT_WIDTH = 10
+PATH_SEPARATOR = "/"
+# `path` only holds digits and "/", and ":" sorts right after "9", so the range
+# [prefix, prefix + ":") holds exactly the paths starting with `prefix`.
+PATH_UPPER_BOUND = ":"
+
+MAX_CHILDREN = 10
+MAX_DEPTH = 10
+
+# Columns maintained with set-based UPDATEs, which a plain `save()` must not overwrite
+# with the possibly stale values loaded on the instance.
+DERIVED_FIELDS = ("path", "depth", "child_count", "revision")
+
+# SQLite FTS5 table indexing the trigrams of `Tree.value`, kept in sync by triggers, see
+# migration 0008. Substring searches shorter than a trigram fall back to a table scan.
+VALUE_SEARCH_TABLE = "tree_api_tree_value_fts"
+TRIGRAM_LENGTH = 3
+SEARCH_MODES = ("exact", "prefix", "contains")
+# Sorts after every character, see `PATH_UPPER_BOUND`.
+VALUE_UPPER_BOUND = chr(0x10FFFF)
+
+
+def path_segment(node_id):
+    return f"{node_id:0{PATH_SEGMENT_WIDTH}d}{PATH_SEPARATOR}"
+
+
+def path_ids(path):
+    return [int(segment) for segment in path.split(PATH_SEPARATOR) if segment]
+
+
+def value_search_supported(connection):
+    # The trigram tokenizer was added in SQLite 3.34.
+    return connection.vendor == "sqlite" and sqlite3.sqlite_version_info >= (3, 34)
+
+
+def closure_enabled():
+    return getattr(settings, "TREE_API_CLOSURE_TABLE", False)
+
+
+def descendants_q(node, include_self=False):
+    """
+    The condition matching the descendants of `node`: a lookup of its rows in the closure table
+    when it is enabled, a range scan on the indexed `path` column otherwise.
+    """
+    if closure_enabled():
+        links = TreeClosure.objects.filter(
+            ancestor_id=node.pk, depth__gte=0 if include_self else 1
+        )
+        return Q(pk__in=links.values("descendant_id"))
+
+    prefix = node.subtree_path
+    nodes = Q(path__gte=prefix, path__lt=prefix + PATH_UPPER_BOUND)
+    return Q(pk=node.pk) | nodes if include_self else nodes
+
+
+class TreeQuerySet(models.QuerySet):
+    def descendants_of(self, node):
+        """
+        Return all the descendants of `node`, excluding the node itself.
+        """
+        return self.filter(descendants_q(node))
+
+    def subtree_of(self, node):
+        """
+        Return `node` and all its descendants.
+        """
+        return self.filter(descendants_q(node, include_self=True))
+
+    def search(self, term, mode="contains"):
+        """
+        Return the nodes whose `value` equals `term`, starts with it, or contains it, depending
+        on `mode`.
+
+        Exact and prefix matches are case sensitive range scans on the index of `value`.
+        Substring matches are case insensitive, and use the trigram index of `value` on SQLite.
+        """
+        if mode == "exact":
+            return self.filter(value=term)
+        if mode == "prefix":
+            return self.filter(value__gte=term, value__lt=term + VALUE_UPPER_BOUND)
+        if len(term) < TRIGRAM_LENGTH or not value_search_supported(
+            connections[self.db]
+        ):
+            return self.filter(value__icontains=term)
+        # A quoted FTS5 string matches the trigrams of `term` as a phrase.
+        phrase = '"' + term.replace('"', '""') + '"'
+        matches = RawSQL(
+            f"SELECT rowid FROM {VALUE_SEARCH_TABLE} WHERE {VALUE_SEARCH_TABLE} MATCH %s",
+            [phrase],
+        )
+        return self.filter(pk__in=matches)
+
+    def reserve_children(self, parent, count=1):
+        """
+        Add `count` to the `child_count` of `parent` with a conditional UPDATE, which only matches
+        while the parent stays within the children and depth limits, so concurrent inserts cannot
+        push it over them. Raise a `ValidationError` when the limits would be exceeded.
+        """
+        reserved = self.filter(
+            pk=parent.pk,
+            child_count__lte=MAX_CHILDREN - count,
+            depth__lt=MAX_DEPTH - 1,
+        ).update(child_count=F("child_count") + count)
+        if not reserved:
+            if parent.depth >= MAX_DEPTH - 1:
+                raise ValidationError(f"A tree can have at most {MAX_DEPTH} levels.")
+            raise ValidationError(
+                f"A parent node can have at most {MAX_CHILDREN} children."
+            )
+        parent.child_count += count
+
+    def touch(self, node, subtree=False):
+        """
+        Bump the revision of `node` and all its ancestors, and of all its descendants as well when
+        `subtree` is set, with a single UPDATE.
+        """
+        nodes = Q(pk__in=[*node.ancestor_ids, node.pk])
+        if subtree:
+            nodes |= descendants_q(node)
+        return self.filter(nodes).update(revision=F("revision") + 1)
+
+    def soft_delete(self, node):
+        """
+        Mark `node` and all its descendants as deleted with a single UPDATE, and return the number
+        of nodes that were not already deleted.
+        """
+        with transaction.atomic():
+            affected = (
+                self.subtree_of(node)
+                .filter(deleted=False)
+                .update(deleted=True, deleted_at=timezone.now())
+            )
+            if affected:
+                self.touch(node, subtree=True)
+                tree_changed.send(
+                    sender=Tree, action="soft_delete", node=node, cascade=True
+                )
+            return affected
+
+    def restore(self, node, cascade=False):
+        """
+        Restore `node`, or `node` and all its descendants when `cascade` is set, with a single
+        UPDATE, and return the number of nodes that were deleted.
+
+        Restoring only the node is refused while one of its ancestors is still deleted, which is
+        checked with one query over the ancestor ids stored in `path`.
+        """
+        with transaction.atomic():
+            if cascade:
+                nodes = self.subtree_of(node)
+            elif self.filter(pk__in=node.ancestor_ids, deleted=True).exists():
+                raise ValidationError(
+                    "A node cannot be restored while one of its ancestors is deleted."
+                )
+            else:
+                nodes = self.filter(pk=node.pk)
+            affected = nodes.filter(deleted=True).update(deleted=False, deleted_at=None)
+            if affected:
+                self.touch(node, subtree=cascade)
+                tree_changed.send(
+                    sender=Tree, action="restore", node=node, cascade=cascade
+                )
+            return affected
+
+    def move(self, node, parent):
+        """
+        Move `node` and its whole subtree under `parent`, or to the top level when `parent` is
+        None, in one transaction.
+
+        The cycle check reads the `path` of `parent`, and the depth limit is checked against the
+        deepest descendant with one aggregate query. The paths and depths of all the descendants
+        are then rewritten with a single UPDATE, see `Tree.save()`, so the number of queries does
+        not depend on the size of the subtree. Moving a node that is not deleted under a deleted
+        parent is refused, as every descendant of a deleted node is deleted as well.
+        """
+        if parent is not None and parent.deleted and not node.deleted:
+            raise ValidationError("A node cannot be moved under a deleted node.")
+        if node.parent_id == (parent.pk if parent else None):
+            return node
+        previous_parent_id = node.parent_id
+        node.parent = parent
+        try:
+            node.save(update_fields=["parent"])
+        except ValidationError:
+            node.parent_id = previous_parent_id
+            raise
+        return node
+
+    def validate_subtree(self, specs, parent=None):
+        """
+        Check the nested node `specs` against the value length, children and depth limits in
+        memory, and raise a `ValidationError` listing every problem found.
+        """
+        max_length = Tree._meta.get_field("value").max_length
+        errors = []
+        first_depth = parent.depth + 1 if parent else 0
+        existing_children = parent.child_count if parent else 0
+        if not isinstance(specs, list):
+            raise ValidationError("A subtree must be a list of nodes.")
+        if existing_children + len(specs) > MAX_CHILDREN:
+            errors.append(f"A parent node can have at most {MAX_CHILDREN} children.")
+        if specs and first_depth >= MAX_DEPTH:
+            errors.append(f"A tree can have at most {MAX_DEPTH} levels.")
+
+        pending = deque((spec, f"[{i}]", first_depth) for i, spec in enumerate(specs))
+        while pending:
+            spec, location, depth = pending.popleft()
+            if not isinstance(spec, dict):
+                errors.append(f"{location}: a node must be an object.")
+                continue
+            value = spec.get("value")
+            if not isinstance(value, str) or not value or len(value) > max_length:
+                errors.append(
+                    f"{location}.value: a string of 1 to {max_length} characters is "
+                    "required."
+                )
+            children = spec.get("children", [])
+            if not isinstance(children, list):
+                errors.append(f"{location}.children: must be a list of nodes.")
+                continue
+            if len(children) > MAX_CHILDREN:
+                errors.append(
+                    f"{location}.children: a parent node can have at most "
+                    f"{MAX_CHILDREN} children."
+                )
+            if children and depth + 1 >= MAX_DEPTH:
+                errors.append(
+                    f"{location}.children: a tree can have at most {MAX_DEPTH} levels."
+                )
+                continue
+            pending.extend(
+                (child, f"{location}.children[{i}]", depth + 1)
+                for i, child in enumerate(children)
+            )
+
+        if errors:
+            raise ValidationError(errors)
+
+    def create_subtree(self, specs, parent=None):
+        """
+        Insert the nested node `specs` under `parent` (or as roots) with one `bulk_create` per
+        level, and return the created ids in the same nested structure.
+
+        Each spec is a dict with a `value` and an optional list of `children` specs. The whole
+        document is validated in memory before anything is written, and the insert runs in a
+        single transaction, so an invalid document never leaves a partial subtree behind. An
+        empty list writes nothing.
+        """
+        self.validate_subtree(specs, parent)
+        if not specs:
+            return []
+
+        created = []
+        created_nodes = []
+        level = [(parent, spec, created) for spec in specs]
+        with transaction.atomic():
+            if parent:
+                self.reserve_children(parent, len(specs))
+            while level:
+                nodes = [
+                    Tree(
+                        value=spec["value"],
+                        parent=node_parent,
+                        path=node_parent.subtree_path if node_parent else "",
+                        depth=node_parent.depth + 1 if node_parent else 0,
+                        child_count=len(spec.get("children", [])),
+                    )
+                    for node_parent, spec, _ in level
+                ]
+                self.bulk_create(nodes)
+                created_nodes.extend(nodes)
+                if closure_enabled():
+                    TreeClosure.objects.link(nodes)
+
+                next_level = []
+                for node, (_, spec, siblings) in zip(nodes, level):
+                    result = {"id": node.id, "value": node.value, "children": []}
+                    siblings.append(result)
+                    next_level.extend(
+                        (node, child, result["children"])
+                        for child in spec.get("children", [])
+                    )
+                level = next_level
+            if parent:
+                self.touch(parent)
+            tree_changed.send(sender=Tree, action="create", nodes=created_nodes)
+        return created
+
+    def purge_batch(self, deleted_before, batch_size=500):
+        """
+        Hard delete up to `batch_size` nodes deleted before `deleted_before` that have no
+        children left, in one short transaction, and return their number.
+
+        Only leaves are picked, deepest first, so repeated batches delete deleted subtrees from
+        the leaves upward and a node goes only once all its descendants went. Every statement
+        is set-based: the rows, with their closure table rows, are removed with raw DELETEs
+        instead of the `on_delete=CASCADE` collector of `QuerySet.delete()`, which loads them
+        all into memory first. The `child_count` of the parents is recounted and the revision
+        of every ancestor bumped with one UPDATE each.
+        """
+        with transaction.atomic(using=self.db):
+            has_children = Tree.objects.filter(parent=OuterRef("pk"))
+            rows = list(
+                self.filter(deleted=True, deleted_at__lt=deleted_before)
+                .filter(~Exists(has_children))
+                .order_by("-depth", "id")
+                .values_list("id", "parent_id", "path")[:batch_size]
+            )
+            if not rows:
+                return 0
+
+            node_ids = [node_id for node_id, _, _ in rows]
+            placeholders = ", ".join(["%s"] * len(node_ids))
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {TreeClosure._meta.db_table} "
+                    f"WHERE descendant_id IN ({placeholders})",
+                    node_ids,
+                )
+                cursor.execute(
+                    f"DELETE FROM {Tree._meta.db_table} WHERE id IN ({placeholders})",
+                    node_ids,
+                )
+
+            parent_ids = {parent_id for _, parent_id, _ in rows if parent_id}
+            if parent_ids:
+                children = (
+                    Tree.objects.filter(parent=OuterRef("pk"))
+                    .values("parent")
+                    .annotate(count=Count("pk"))
+                    .values("count")
+                )
+                self.filter(pk__in=parent_ids).update(
+                    child_count=Coalesce(Subquery(children), 0)
+                )
+                ancestor_ids = {
+                    ancestor_id for _, _, path in rows for ancestor_id in path_ids(path)
+                }
+                self.filter(pk__in=ancestor_ids).update(revision=F("revision") + 1)
+            tree_changed.send(sender=Tree, action="purge", node_ids=node_ids)
+        return len(node_ids)
+
+    def delete_all(self):
+        """
+        Delete every node with a single DELETE statement, without loading them into memory as the
+        `on_delete=CASCADE` collector of `QuerySet.delete()` does.
+        """
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(f"DELETE FROM {TreeClosure._meta.db_table}")
+                cursor.execute(f"DELETE FROM {Tree._meta.db_table}")
+                deleted = cursor.rowcount
+            tree_changed.send(sender=Tree, action="clear")
+        return deleted
 
 
 class Tree(models.Model):
     value = models.CharField(max_length=30)
     deleted = models.BooleanField(default=False)
+    # When the node was soft deleted, see `TreeQuerySet.purge_batch`.
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
     parent = models.ForeignKey(
         "self", on_delete=models.CASCADE, null=True, blank=True, related_name="children"
     )
+    # Materialized path of the ancestor ids, from the root down to the parent.
+    path = models.CharField(
+        max_length=255, blank=True, default="", db_index=True, editable=False
+    )
+    depth = models.PositiveSmallIntegerField(default=0, db_index=True, editable=False)
+    child_count = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Bumped whenever the node or one of its descendants changes.
+    revision = models.PositiveBigIntegerField(default=0, editable=False)
+
+    objects = TreeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Children lookups that skip deleted branches, see `load_subtree_page`.
+            models.Index(fields=["parent", "deleted"], name="tree_parent_deleted_idx"),
+            # Exact and prefix searches, see `TreeQuerySet.search`.
+            models.Index(fields=["value"], name="tree_value_idx"),
+            # Deleted nodes old enough to be purged.
+            models.Index(fields=["deleted_at"], name="tree_deleted_at_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get("parent_id")
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        # The reloaded parent is the one stored, not a pending move.
+        if fields is None or "parent" in fields or "parent_id" in fields:
+            self._loaded_parent_id = self.parent_id
+
+    @property
+    def subtree_path(self):
+        """
+        The path prefix shared by this node's descendants.
+        """
+        return self.path + path_segment(self.pk)
+
+    @property
+    def ancestor_ids(self):
+        return path_ids(self.path)
 
     def to_dict(self):
         return {
             "id": self.id,
             "value": self.value,
             "deleted": self.deleted,
-            "parent": self.parent.id if self.parent else None,
+            "parent": self.parent_id,
         }
 
+    @property
+    def parent_changed(self):
+        return self._state.adding or self.parent_id != getattr(
+            self, "_loaded_parent_id", self.parent_id
+        )
+
     def clean(self):
-        if self.parent and self.parent.children.count() >= 10:
-            raise ValidationError("A parent node can have at most 10 children.")
+        # Saves that keep the parent, such as a new value, skip the limits entirely. For the
+        # others this is only an early check on the loaded parent, the limits are enforced
+        # atomically by `reserve_children` in `save()`.
+        if not self.parent_changed or not self.parent:
+            return
+        if self.parent.child_count >= MAX_CHILDREN:
+            raise ValidationError(
+                f"A parent node can have at most {MAX_CHILDREN} children."
+            )
+        if self.parent.depth >= MAX_DEPTH - 1:
+            raise ValidationError(f"A tree can have at most {MAX_DEPTH} levels.")
+        if self.pk and (
+            self.parent.pk == self.pk
+            or path_segment(self.pk) in self.parent.subtree_path
+        ):
+            raise ValidationError("A node cannot be moved under its own subtree.")
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        # Like Django, an empty `update_fields` saves nothing.
+        if kwargs.get("update_fields") is not None and not kwargs["update_fields"]:
+            return
+        # An unchanged parent needs neither the limits nor the foreign key lookup.
+        self.full_clean(exclude=None if self.parent_changed else ["parent"])
+
+        with transaction.atomic():
+            self._save(*args, **kwargs)
+
+    def _save(self, *args, **kwargs):
+        moved = not self._state.adding and self.parent_changed
+        if self._state.adding or moved:
+            old_path, old_depth = self.path, self.depth
+            if moved:
+                deepest = Tree.objects.descendants_of(self).aggregate(
+                    deepest=Max("depth")
+                )["deepest"]
+                height = deepest - old_depth if deepest is not None else 0
+                new_depth = self.parent.depth + 1 if self.parent else 0
+                if new_depth + height >= MAX_DEPTH:
+                    raise ValidationError(
+                        f"A tree can have at most {MAX_DEPTH} levels."
+                    )
+                if self._loaded_parent_id is not None:
+                    Tree.objects.filter(pk=self._loaded_parent_id).update(
+                        child_count=F("child_count") - 1
+                    )
+            if self.parent:
+                Tree.objects.reserve_children(self.parent)
+                self.path = self.parent.subtree_path
+                self.depth = self.parent.depth + 1
+            else:
+                self.path = ""
+                self.depth = 0
+
+        if self.deleted and self.deleted_at is None:
+            self.deleted_at = timezone.now()
+        elif not self.deleted:
+            self.deleted_at = None
+
+        if not self._state.adding:
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                update_fields = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key
+                ]
+            update_fields = [
+                name for name in update_fields if name not in DERIVED_FIELDS
+            ]
+            if moved:
+                update_fields += ["path", "depth"]
+            kwargs["update_fields"] = update_fields
+
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        Tree.objects.touch(self)
+        if adding and closure_enabled():
+            TreeClosure.objects.link([self])
+
+        if moved:
+            Tree.objects.filter(pk__in=path_ids(old_path)).update(
+                revision=F("revision") + 1
+            )
+            old_subtree_path = old_path + path_segment(self.pk)
+            Tree.objects.filter(
+                path__gte=old_subtree_path,
+                path__lt=old_subtree_path + PATH_UPPER_BOUND,
+            ).update(
+                path=Concat(
+                    Value(self.subtree_path),
+                    Substr("path", len(old_subtree_path) + 1),
+                ),
+                depth=F("depth") + (self.depth - old_depth),
+            )
+            if closure_enabled():
+                TreeClosure.objects.relink(self, old_path)
+        self._loaded_parent_id = self.parent_id
 
     def __str__(self):
         return self.value
+
+
+class TreeClosureQuerySet(models.QuerySet):
+    def link(self, nodes):
+        """
+        Insert the rows of newly created `nodes`, whose ancestors are all known from their
+        `path`, with a single INSERT.
+        """
+        self.bulk_create(
+            TreeClosure(ancestor_id=ancestor_id, descendant_id=node.pk, depth=distance)
+            for node in nodes
+            for distance, ancestor_id in enumerate(
+                [node.pk, *reversed(node.ancestor_ids)]
+            )
+        )
+
+    def relink(self, node, old_path):
+        """
+        Move the rows of the subtree of `node` from the ancestors of `old_path` to its current
+        ancestors with one DELETE and one INSERT ... SELECT, whatever the size of the subtree.
+        """
+        closure = TreeClosure._meta.db_table
+        old_ancestor_ids = path_ids(old_path)
+        with connections[self.db].cursor() as cursor:
+            if old_ancestor_ids:
+                placeholders = ", ".join(["%s"] * len(old_ancestor_ids))
+                cursor.execute(
+                    f"DELETE FROM {closure} "
+                    f"WHERE descendant_id IN "
+                    f"(SELECT descendant_id FROM {closure} WHERE ancestor_id = %s) "
+                    f"AND ancestor_id IN ({placeholders})",
+                    [node.pk, *old_ancestor_ids],
+                )
+            if node.parent_id is not None:
+                # Every row of the new parent, its own included, paired with every row of the
+                # subtree.
+                cursor.execute(
+                    f"INSERT INTO {closure} (ancestor_id, descendant_id, depth) "
+                    f"SELECT link.ancestor_id, subtree.descendant_id, "
+                    f"link.depth + subtree.depth + 1 "
+                    f"FROM {closure} link "
+                    f"JOIN {closure} subtree ON subtree.ancestor_id = %s "
+                    f"WHERE link.descendant_id = %s",
+                    [node.pk, node.parent_id],
+                )
+
+    def rebuild(self):
+        """
+        Rebuild every row from the `parent` pointers alone, one INSERT ... SELECT per level, and
+        return the number of rows.
+        """
+        closure = TreeClosure._meta.db_table
+        tree = Tree._meta.db_table
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(f"DELETE FROM {closure}")
+                cursor.execute(
+                    f"INSERT INTO {closure} (ancestor_id, descendant_id, depth) "
+                    f"SELECT id, id, 0 FROM {tree}"
+                )
+                rows = cursor.rowcount
+                for depth in range(MAX_DEPTH - 1):
+                    # Every node gets its ancestors at `depth + 1` from the rows of its
+                    # parent at `depth`.
+                    cursor.execute(
+                        f"INSERT INTO {closure} (ancestor_id, descendant_id, depth) "
+                        f"SELECT link.ancestor_id, node.id, link.depth + 1 "
+                        f"FROM {tree} node "
+                        f"JOIN {closure} link ON link.descendant_id = node.parent_id "
+                        f"WHERE link.depth = %s",
+                        [depth],
+                    )
+                    if not cursor.rowcount:
+                        break
+                    rows += cursor.rowcount
+        return rows
+
+
+class TreeClosure(models.Model):
+    """
+    One row per ancestor and descendant pair of the tree, plus every node paired with itself at
+    depth 0, so the descendants and the ancestors of a node are both a single indexed lookup.
+
+    The rows are only maintained while `TREE_API_CLOSURE_TABLE` is set. Run the
+    `rebuild_closure` command after turning it on.
+    """
+
+    ancestor = models.ForeignKey(
+        Tree, on_delete=models.CASCADE, related_name="descendant_links"
+    )
+    descendant = models.ForeignKey(
+        Tree, on_delete=models.CASCADE, related_name="ancestor_links"
+    )
+    depth = models.PositiveSmallIntegerField()
+
+    objects = TreeClosureQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ancestor", "descendant"], name="tree_closure_unique_pair"
+            ),
+        ]
+
+
+class TreeGeneration(models.Model):
+    """
+    A single row counting the writes to the tree, which lets every worker tell whether its
+    in-memory tree index is still current with one cheap query.
+    """
+
+    generation = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def current(cls):
+        return (
+            cls.objects.filter(pk=1).values_list("generation", flat=True).first() or 0
+        )
+
+    @classmethod
+    def bump(cls):
+        with transaction.atomic():
+            if not cls.objects.filter(pk=1).update(generation=F("generation") + 1):
+                cls.objects.create(pk=1, generation=1)
+            return cls.current()
+
+
+class TreeChange(models.Model):
+    """
+    An append-only log of the writes to the tree, one row per write however many nodes it
+    touched, which lets clients that mirror the tree fetch what changed since their last sync.
+    See `changelog.py`.
+    """
+
+    action = models.CharField(max_length=16)
+    # Not a foreign key: entries outlive the nodes they describe.
+    node_id = models.BigIntegerField(null=True)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,49 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+
+from .middleware import timing
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class FlatTreeRenderer(JSONRenderer):
+    """
+    Renders a subtree flattened by `flatten_subtree` as compact JSON, selected with `?format=flat`
+    or `Accept: application/vnd.tree.flat+json`.
+    """
+
+    media_type = "application/vnd.tree.flat+json"
+    format = "flat"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timing("serialize"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class MessagePackTreeRenderer(BaseRenderer):
+    """
+    Renders a subtree flattened by `flatten_subtree` as MessagePack, selected with `?format=msgpack`
+    or `Accept: application/x-msgpack`. Only available when the `msgpack` package is installed.
+    """
+
+    media_type = "application/x-msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        with timing("serialize"):
+            return msgpack.packb(data)
+
+
+# Formats that are rendered from the flat representation of a subtree.
+FLAT_FORMATS = {"flat", "msgpack"}
+
+SUBTREE_RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, FlatTreeRenderer]
+if msgpack is not None:
+    SUBTREE_RENDERERS.append(MessagePackTreeRenderer)
@@ -1,8 +1,20 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from .models import Tree
 
 
 class TreeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tree
-        fields = "__all__"
+        fields = ["id", "value", "deleted", "parent"]
+
+    def save(self, **kwargs):
+        # The tree limits are enforced by `Tree.save()`, so that they also hold under
+        # concurrent writes; report them as a 400 like any other validation error.
+        try:
+            return super().save(**kwargs)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: error.messages}
+            )
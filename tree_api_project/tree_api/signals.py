@@ -0,0 +1,10 @@
+from django.dispatch import Signal
+
+# Sent by the set-based write paths of `TreeQuerySet`, which bypass `post_save` and
+# `post_delete`, with the `action` that was applied:
+#
+# - "soft_delete" and "restore", with the top `node` and whether it was a `cascade`
+# - "create", with the list of created `nodes`
+# - "purge", with the `node_ids` of the deleted nodes that were removed from the table
+# - "clear", after every node was deleted
+tree_changed = Signal()
@@ -1,14 +1,30 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from io import StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Max
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from .models import Tree
+from . import index, urls
+from .cache import get_cache
+from .changelog import prune_changes
+from .management.commands.benchmark import run_benchmark
+from .models import Tree, TreeChange, TreeClosure, TreeGeneration
+from .serializers import TreeSerializer
 
 
 class TreeApiTests(TestCase):
     def setUp(self):
         self.client = APIClient()
+        get_cache().clear()
 
     def test_add_node(self):
         print("\r\nCreate a node")
@@ -64,6 +80,121 @@ class TreeApiTests(TestCase):
 
         print(response.json())
 
+    def test_add_subtree(self):
+        print("\r\nAdd a subtree to a node")
+
+        node = Tree.objects.create(value="Node 1")
+        data = {
+            "value": "Node 2",
+            "children": [
+                {"value": f"Node 2.{i}", "children": [{"value": f"Node 2.{i}.1"}]}
+                for i in range(1, 4)
+            ],
+        }
+        url = reverse("add-subtree", kwargs={"node_parent_id": int(node.id)})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        inserts = [q for q in queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 3)
+
+        created = response.json()
+        self.assertEqual(created["value"], "Node 2")
+        self.assertEqual(Tree.objects.get(pk=created["id"]).parent_id, node.id)
+        grandchild = created["children"][2]["children"][0]
+        self.assertEqual(grandchild["value"], "Node 2.3.1")
+        self.assertEqual(Tree.objects.get(pk=grandchild["id"]).depth, 3)
+        print(created)
+
+        # An empty list creates nothing, with or without the change log.
+        node.refresh_from_db()
+        for enabled in (False, True):
+            with self.settings(TREE_API_CHANGE_LOG=enabled):
+                with self.assertNumQueries(1):
+                    response = self.client.post(url, [], format="json")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(response.json(), [])
+        self.assertFalse(TreeChange.objects.exists())
+        self.assertEqual(Tree.objects.get(pk=node.pk).revision, node.revision)
+
+    def test_add_invalid_subtree(self):
+        print("\r\nReject a subtree that breaks the tree limits")
+
+        node = Tree.objects.create(value="Node 1")
+        url = reverse("add-subtree", kwargs={"node_parent_id": int(node.id)})
+
+        data = {"value": "Node 2", "children": [{"value": "x" * 31}]}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        data = {"value": "Node 2", "children": [{"value": "x"}] * 11}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        data = {"value": "Level 10"}
+        for level in range(9, 1, -1):
+            data = {"value": f"Level {level}", "children": [data]}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        data = {"value": "Level 11"}
+        for level in range(10, 1, -1):
+            data = {"value": f"Level {level}", "children": [data]}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        print(response.json())
+
+        self.assertEqual(Tree.objects.count(), 10)
+
+    def test_children_and_depth_limits(self):
+        print("\r\nEnforce the children and depth limits with the stored counters")
+
+        node = Tree.objects.create(value="Node 1")
+        stale_node = Tree.objects.get(pk=node.pk)
+        for i in range(1, 11):
+            Tree.objects.create(value=f"Node 1.{i}", parent=node)
+        node.refresh_from_db()
+        self.assertEqual(node.child_count, 10)
+
+        self.assertEqual(stale_node.child_count, 0)
+        with self.assertRaises(ValidationError):
+            Tree.objects.create(value="Node 1.11", parent=stale_node)
+
+        url = reverse("create-subnode", kwargs={"node_parent_id": int(node.id)})
+        response = self.client.post(url, {"value": "Node 1.11"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        print(response.json())
+
+        parent_node = Tree.objects.get(value="Node 1.1")
+        for level in range(2, 10):
+            parent_node = Tree.objects.create(
+                value=f"Level {level}", parent=parent_node
+            )
+        self.assertEqual(parent_node.depth, 9)
+        with self.assertRaises(ValidationError):
+            Tree.objects.create(value="Level 10", parent=parent_node)
+
+        url = reverse("change-node-value", kwargs={"node_id": int(parent_node.id)})
+        with self.assertNumQueries(5):
+            response = self.client.put(url, {"value": "Last Level"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        other_node = Tree.objects.create(value="Node 2")
+        level_2 = Tree.objects.get(value="Level 2")
+        level_2.parent = other_node
+        level_2.save()
+        node.refresh_from_db()
+        other_node.refresh_from_db()
+        self.assertEqual(node.child_count, 10)
+        self.assertEqual(other_node.child_count, 1)
+        self.assertEqual(Tree.objects.get(value="Node 1.1").child_count, 0)
+
+        level_2.parent = Tree.objects.create(
+            value="Deep Node", parent=Tree.objects.get(value="Node 1.2")
+        )
+        with self.assertRaises(ValidationError):
+            level_2.save()
+
     def test_set_node_new_value(self):
         print("\r\nChange a node Value")
 
@@ -97,6 +228,23 @@ class TreeApiTests(TestCase):
         self.assertTrue(node.deleted)
         self.assertTrue(child_node.deleted)
 
+    def test_delete_node_in_constant_queries(self):
+        print("\r\nDelete a node and its subtree with a single UPDATE")
+
+        node = Tree.objects.create(value="Node 1")
+        for i in range(1, 4):
+            child_node = Tree.objects.create(value=f"Node 1.{i}", parent=node)
+            for j in range(1, 4):
+                Tree.objects.create(value=f"Node 1.{i}.{j}", parent=child_node)
+        Tree.objects.filter(value="Node 1.1.1").update(deleted=True)
+
+        url = reverse("delete-node", kwargs={"node_id": int(node.id)})
+        with self.assertNumQueries(5):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response["X-Affected-Nodes"], "12")
+        self.assertFalse(Tree.objects.filter(deleted=False).exists())
+
     def test_reset_node(self):
         print("\r\nReset a node with 4 levels and 10 nodes")
 
@@ -107,6 +255,41 @@ class TreeApiTests(TestCase):
         print(response.json())
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_reset_tree_with_one_insert_per_level(self):
+        print("\r\nReset the tree with a custom shape and one insert per level")
+
+        url = reverse("reset-tree")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {"fanout": 2, "depth": 3}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Tree.objects.count(), 15)
+        inserts = [q for q in queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 4)
+
+        data = response.json()["reset_node"]
+        self.assertEqual(data["value"], "node1")
+        self.assertEqual(
+            [child["value"] for child in data["children"]], ["node1.1", "node1.2"]
+        )
+        self.assertEqual(Tree.objects.get(value="node2.2.1").depth, 3)
+
+        for data in (
+            {"fanout": 11},
+            [2, 2],
+            {"fanout": 1.7},
+            {"fanout": True},
+            {"fanout": "2"},
+            {"fanout": [2, "2"]},
+            {"fanout": 2, "depth": -1},
+            {"fanout": 2, "depth": 2.0},
+        ):
+            response = self.client.post(url, data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Tree.objects.count(), 15)
+        self.assertEqual(
+            response.json()["error"], ["`depth` must be an integer between 0 and 9."]
+        )
+
     def test_restore_deleted_node(self):
         print("\r\nRestore a deleted Node")
 
@@ -132,6 +315,39 @@ class TreeApiTests(TestCase):
         self.assertFalse(node.deleted)
         self.assertFalse(child_node.deleted)
 
+    def test_restore_only_deleted_node(self):
+        print("\r\nRestore a deleted Node without its subnodes")
+
+        node = Tree.objects.create(value="Node 1")
+        child_node = Tree.objects.create(value="Child Node", parent=node)
+        grandchild_node = Tree.objects.create(
+            value="Grandchild Node", parent=child_node
+        )
+        Tree.objects.soft_delete(node)
+
+        url = reverse("restore-deleted-node", kwargs={"node_id": int(child_node.id)})
+        response = self.client.put(f"{url}?cascade=false", format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        url = reverse("restore-deleted-node", kwargs={"node_id": int(node.id)})
+        with self.assertNumQueries(5):
+            response = self.client.put(f"{url}?cascade=false", format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["X-Affected-Nodes"], "1")
+
+        node.refresh_from_db()
+        child_node.refresh_from_db()
+        self.assertFalse(node.deleted)
+        self.assertTrue(child_node.deleted)
+
+        url = reverse("restore-deleted-node", kwargs={"node_id": int(child_node.id)})
+        response = self.client.put(f"{url}?cascade=true", format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["X-Affected-Nodes"], "2")
+
+        grandchild_node.refresh_from_db()
+        self.assertFalse(grandchild_node.deleted)
+
     def test_obtain_subnode_from_specified_node(self):
         print("\r\nObtain a subnode from specified node")
 
@@ -165,3 +381,950 @@ class TreeApiTests(TestCase):
         self.assertEqual(data["value"], node.value)
         self.assertEqual(data["parent"], None)
         self.assertEqual(len(data["children"]), 1)
+
+    def test_obtain_subtree_in_constant_queries(self):
+        print("\r\nObtain a subtree with a single descendants query")
+
+        node = Tree.objects.create(value="Node 1")
+        for i in range(1, 6):
+            child_node = Tree.objects.create(value=f"Node 1.{i}", parent=node)
+            for j in range(1, 6):
+                Tree.objects.create(value=f"Node 1.{i}.{j}", parent=child_node)
+
+        url = reverse("get-subtree", kwargs={"node_id": int(node.id)})
+        with self.assertNumQueries(2):
+            response = self.client.get(url, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data = response.json()
+        self.assertEqual(len(data["children"]), 5)
+        self.assertEqual(
+            [child["value"] for child in data["children"][0]["children"]],
+            [f"Node 1.1.{j}" for j in range(1, 6)],
+        )
+
+    def test_obtain_subtree_from_cache(self):
+        print("\r\nObtain a subtree from the cache until it changes")
+
+        node = Tree.objects.create(value="Node 1")
+        child_node = Tree.objects.create(value="Child Node", parent=node)
+        Tree.objects.create(value="Grandchild Node", parent=child_node)
+        url = reverse("get-subtree", kwargs={"node_id": int(node.id)})
+        child_url = reverse("get-subtree", kwargs={"node_id": int(child_node.id)})
+
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+        self.assertEqual(self.client.get(child_url)["X-Cache"], "MISS")
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "HIT")
+
+        url_subnode = reverse(
+            "create-subnode", kwargs={"node_parent_id": int(child_node.id)}
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url_subnode, {"value": "New Node"}, format="json")
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.json()["children"][0]["children"]), 2)
+        self.assertEqual(self.client.get(child_url)["X-Cache"], "MISS")
+
+        url_delete = reverse("delete-node", kwargs={"node_id": int(node.id)})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(url_delete)
+        response = self.client.get(child_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertTrue(response.json()["deleted"])
+
+        response = self.client.get(reverse("subtree-cache-stats"))
+        self.assertEqual(response.json()["hits"], 1)
+        self.assertEqual(response.json()["misses"], 5)
+
+    def test_obtain_subtree_not_modified(self):
+        print("\r\nObtain a 304 for a subtree that did not change")
+
+        node = Tree.objects.create(value="Node 1")
+        child_node = Tree.objects.create(value="Child Node", parent=node)
+        other_node = Tree.objects.create(value="Node 2")
+        url = reverse("get-subtree", kwargs={"node_id": int(node.id)})
+
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+        self.client.post(
+            reverse("create-subnode", kwargs={"node_parent_id": int(other_node.id)}),
+            {"value": "Other Child"},
+            format="json",
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.post(
+            reverse("create-subnode", kwargs={"node_parent_id": int(child_node.id)}),
+            {"value": "Grandchild Node"},
+            format="json",
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.json()["children"][0]["children"]), 1)
+
+        # A write from another worker only shows in the database, not in this cache.
+        Tree.objects.filter(pk=child_node.pk).update(value="Renamed")
+        Tree.objects.touch(child_node)
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["children"][0]["value"], "Renamed")
+
+    def test_subtree_matches_serializer(self):
+        print("\r\nSerialize subtrees like TreeSerializer without running it per node")
+
+        self.client.post(
+            reverse("reset-tree"), {"fanout": 2, "depth": 3}, format="json"
+        )
+        Tree.objects.soft_delete(Tree.objects.get(value="node2.1"))
+        root = Tree.objects.get(value="root")
+        response = self.client.get(
+            reverse("get-subtree", kwargs={"node_id": int(root.id)})
+        )
+
+        serialized = {
+            row["id"]: dict(row)
+            for row in TreeSerializer(Tree.objects.all(), many=True).data
+        }
+        pending = [response.json()]
+        while pending:
+            data = pending.pop()
+            pending.extend(data.pop("children"))
+            self.assertEqual(
+                list(data.items()), list(serialized.pop(data["id"]).items())
+            )
+        self.assertEqual(serialized, {})
+
+    def test_obtain_subtree_without_deleted_nodes(self):
+        print("\r\nObtain a subtree without its deleted branches")
+
+        self.client.post(
+            reverse("reset-tree"), {"fanout": 2, "depth": 3}, format="json"
+        )
+        deleted_node = Tree.objects.get(value="node1")
+        Tree.objects.soft_delete(deleted_node)
+        root = Tree.objects.get(value="root")
+        url = reverse("get-subtree", kwargs={"node_id": int(root.id)})
+
+        self.assertEqual(len(self.client.get(url).json()["children"]), 2)
+
+        # The node, then one query per level that never reaches below "node1".
+        with self.assertNumQueries(5):
+            response = self.client.get(f"{url}?include_deleted=false")
+        subtree = response.json()
+        self.assertEqual([child["value"] for child in subtree["children"]], ["node2"])
+        self.assertEqual(len(subtree["children"][0]["children"]), 2)
+        self.assertNotIn('"deleted": true', response.content.decode())
+
+        url = reverse("get-subtree", kwargs={"node_id": int(deleted_node.id)})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        response = self.client.get(f"{url}?include_deleted=false")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_obtain_flat_subtree(self):
+        print("\r\nObtain a subtree as flat parallel arrays")
+
+        self.client.post(
+            reverse("reset-tree"), {"fanout": 3, "depth": 4}, format="json"
+        )
+        Tree.objects.soft_delete(Tree.objects.get(value="node2.1"))
+        root = Tree.objects.get(value="root")
+        url = reverse("get-subtree", kwargs={"node_id": int(root.id)})
+
+        nested = self.client.get(url)
+        flat = self.client.get(f"{url}?format=flat")
+        self.assertEqual(flat.status_code, status.HTTP_200_OK)
+        self.assertEqual(flat["Content-Type"], "application/vnd.tree.flat+json")
+        self.assertNotEqual(flat["ETag"], nested["ETag"])
+        self.assertLess(len(flat.content) * 3, len(nested.content))
+
+        data = flat.json()
+        nodes = []
+        for i, node_id in enumerate(data["ids"]):
+            node = {
+                "id": node_id,
+                "value": data["values"][i],
+                "deleted": bool(data["deleted"][i]),
+                "parent": (
+                    data["ids"][data["parents"][i]]
+                    if data["parents"][i] >= 0
+                    else data["parent"]
+                ),
+                "children": [],
+            }
+            nodes.append(node)
+            if data["parents"][i] >= 0:
+                nodes[data["parents"][i]]["children"].append(node)
+        self.assertEqual(nodes[0], nested.json())
+
+        response = self.client.get(url, HTTP_ACCEPT="application/vnd.tree.flat+json")
+        self.assertEqual(response.json(), data)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertIn("Accept", response["Vary"])
+
+        page = self.client.get(f"{url}?format=flat&max_depth=1").json()
+        self.assertEqual(len(page["ids"]), 4)
+        self.assertEqual(page["has_more"], [[1, 3], [2, 3], [3, 3]])
+
+    async def test_async_endpoints(self):
+        print("\r\nObtain subtrees and write nodes through the async endpoints")
+
+        await self.async_client.post(
+            reverse("async-reset-tree"),
+            {"fanout": 2, "depth": 3},
+            content_type="application/json",
+        )
+        root = await Tree.objects.aget(value="root")
+        url = reverse("async-get-subtree", kwargs={"node_id": int(root.id)})
+
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["X-Cache"], "MISS")
+        sync_url = reverse("get-subtree", kwargs={"node_id": int(root.id)})
+        self.assertEqual(
+            response.content,
+            (await self.async_client.get(sync_url)).content,
+        )
+
+        response = await self.async_client.get(
+            url, headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        node = await Tree.objects.aget(value="node1")
+        response = await self.async_client.delete(
+            reverse("async-delete-node", kwargs={"node_id": int(node.id)})
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = await self.async_client.get(f"{url}?include_deleted=false")
+        self.assertEqual(len(response.json()["children"]), 1)
+        query = "?max_depth=1&children_limit=1&include_deleted=false"
+        response = await self.async_client.get(url + query)
+        self.assertTrue(response.json()["children"][0]["has_more"])
+        self.assertEqual(
+            response.content, (await self.async_client.get(sync_url + query)).content
+        )
+
+        response = await self.async_client.post(
+            reverse("async-create-subnode", kwargs={"node_parent_id": int(root.id)}),
+            {"value": "Async Node"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(await Tree.objects.filter(value="Async Node").aexists())
+
+        response = await self.async_client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+        node = await Tree.objects.aget(value="node2.1.1")
+        url = reverse("async-get-ancestors", kwargs={"node_id": int(node.id)})
+        sync_url = reverse("get-ancestors", kwargs={"node_id": int(node.id)})
+        response = await self.async_client.get(f"{url}?siblings=true")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()["ancestors"]), 4)
+        self.assertEqual(
+            response.content,
+            (await self.async_client.get(f"{sync_url}?siblings=true")).content,
+        )
+
+        query = f"?q=node2.1&mode=prefix&under={root.id}&limit=2"
+        response = await self.async_client.get(reverse("async-search-nodes") + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()["results"]), 2)
+        self.assertEqual(
+            response.content,
+            (await self.async_client.get(reverse("search-nodes") + query)).content,
+        )
+
+    def test_stream_subtree(self):
+        print("\r\nStream a subtree from a database cursor")
+
+        self.client.post(
+            reverse("reset-tree"), {"fanout": 3, "depth": 4}, format="json"
+        )
+        Tree.objects.soft_delete(Tree.objects.get(value="node2.1"))
+        Tree.objects.filter(value="node1.2").update(value='node "1.2" é')
+        node = Tree.objects.get(value="node1")
+        url = reverse("get-subtree", kwargs={"node_id": int(node.id)})
+
+        response = self.client.get(url)
+        with self.assertNumQueries(2):
+            streamed = self.client.get(f"{url}?stream=1")
+            body = b"".join(streamed.streaming_content)
+        self.assertEqual(streamed.status_code, status.HTTP_200_OK)
+        self.assertEqual(body, response.content)
+
+        root = Tree.objects.get(value="root")
+        url = reverse("get-subtree", kwargs={"node_id": int(root.id)})
+        with self.settings(TREE_API_STREAM_THRESHOLD=10):
+            streamed = self.client.get(url)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(
+            json.loads(b"".join(streamed.streaming_content)),
+            self.client.get(url).json(),
+        )
+
+        # Below the threshold the subtree is cached, and a cached subtree is never sized.
+        url = reverse("get-subtree", kwargs={"node_id": int(node.id)})
+        with self.settings(TREE_API_STREAM_THRESHOLD=100):
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response["X-Cache"], "HIT")
+
+    @override_settings(TREE_API_IN_MEMORY_INDEX=True, TREE_API_INDEX_CHECK_INTERVAL=60)
+    def test_obtain_subtree_from_index(self):
+        print("\r\nObtain subtrees from the in-memory index")
+
+        index._index = None
+        self.addCleanup(setattr, index, "_index", None)
+        index.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("reset-tree"), {"fanout": 3, "depth": 3}, format="json"
+            )
+        root = Tree.objects.get(value="root")
+        node = Tree.objects.get(value="node1")
+        url = reverse("get-subtree", kwargs={"node_id": int(root.id)})
+
+        def assert_matches_database():
+            with self.settings(TREE_API_IN_MEMORY_INDEX=False):
+                expected = self.client.get(url).content
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response["X-Cache"], "INDEX")
+            self.assertEqual(response.content, expected)
+            return response
+
+        etag = assert_matches_database()["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("create-subnode", kwargs={"node_parent_id": int(node.id)}),
+                {"value": "New Node"},
+                format="json",
+            )
+            self.client.post(
+                reverse("add-subtree", kwargs={"node_parent_id": int(root.id)}),
+                {"value": "New Subtree", "children": [{"value": "New Leaf"}]},
+                format="json",
+            )
+        self.assertNotEqual(assert_matches_database()["ETag"], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(
+                reverse("change-node-value", kwargs={"node_id": int(node.id)}),
+                {"value": "Moved Node", "parent": Tree.objects.get(value="node2.1").id},
+                format="json",
+            )
+            self.client.delete(reverse("delete-node", kwargs={"node_id": int(node.id)}))
+            self.client.put(
+                reverse("restore-deleted-node", kwargs={"node_id": int(node.id)})
+                + "?cascade=false",
+                format="json",
+            )
+        assert_matches_database()
+
+        # A write by another worker is seen after the check interval.
+        Tree.objects.filter(pk=node.pk).update(value="Renamed Node")
+        TreeGeneration.bump()
+        self.assertNotIn("Renamed Node", self.client.get(url).content.decode())
+        with self.settings(TREE_API_INDEX_CHECK_INTERVAL=0):
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+        self.assertIn("Renamed Node", response.content.decode())
+
+        # The generation is bumped with the write itself, so a write whose worker died before
+        # running its commit callbacks is still seen by the others.
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.put(
+                reverse("change-node-value", kwargs={"node_id": int(node.id)}),
+                {"value": "Lost Node"},
+                format="json",
+            )
+        with self.settings(TREE_API_INDEX_CHECK_INTERVAL=0):
+            response = self.client.get(url)
+        self.assertIn("Lost Node", response.content.decode())
+
+    def test_obtain_subtree_page(self):
+        print("\r\nObtain a depth-limited page of a subtree")
+
+        self.client.post(
+            reverse("reset-tree"), {"fanout": 4, "depth": 4}, format="json"
+        )
+        root = Tree.objects.get(value="root")
+        url = reverse("get-subtree", kwargs={"node_id": int(root.id)})
+
+        with self.assertNumQueries(3):
+            response = self.client.get(f"{url}?max_depth=2&children_limit=3")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertTrue(data["has_more"])
+        self.assertEqual(data["child_count"], 4)
+        self.assertEqual(
+            [child["value"] for child in data["children"]], ["node1", "node2", "node3"]
+        )
+        node1 = data["children"][0]
+        self.assertEqual(
+            [child["value"] for child in node1["children"]],
+            ["node1.1", "node1.2", "node1.3"],
+        )
+        self.assertTrue(node1["children"][0]["has_more"])
+        self.assertEqual(node1["children"][0]["child_count"], 4)
+        self.assertEqual(node1["children"][0]["children"], [])
+
+        after = data["children"][-1]["id"]
+        response = self.client.get(f"{url}?max_depth=1&children_limit=3&after={after}")
+        data = response.json()
+        self.assertEqual([child["value"] for child in data["children"]], ["node4"])
+        self.assertNotIn("has_more", data)
+
+        for query in ("?max_depth=-1", f"?after={10**30}", f"?children_limit={10**30}"):
+            response = self.client.get(url + query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(TREE_API_TIMING=True, TREE_API_TIMING_BUDGET_MS=0)
+    def test_request_timing(self):
+        print("\r\nMeasure the queries and timings of every request")
+
+        node = Tree.objects.create(value="Node 1")
+        Tree.objects.create(value="Child Node", parent=node)
+        url = reverse("get-subtree", kwargs={"node_id": int(node.id)})
+
+        with self.assertLogs("tree_api.timing", "INFO") as logs:
+            response = self.client.get(url)
+        metrics = response["Server-Timing"].split(", ")
+        self.assertRegex(metrics[0], r'^db;dur=[\d.]+;desc="2 queries"$')
+        self.assertRegex(metrics[1], r"^serialize;dur=[\d.]+$")
+        self.assertRegex(metrics[2], r"^total;dur=[\d.]+$")
+
+        info, warning = logs.records
+        record = json.loads(info.getMessage())
+        self.assertEqual(record["queries"], 2)
+        self.assertEqual(record["response_bytes"], len(response.content))
+        record = json.loads(warning.getMessage())
+        self.assertEqual(len(record["slow_queries"]), 2)
+        self.assertIn("tree_api_tree", record["slow_queries"][0]["sql"])
+
+        url = reverse("get-ancestors", kwargs={"node_id": int(node.id)})
+        with self.assertLogs("tree_api.timing", "INFO"):
+            response = self.client.get(url)
+        self.assertIn("serialize;dur=", response["Server-Timing"])
+
+    @override_settings(TREE_API_TIMING=True)
+    async def test_request_timing_async(self):
+        print("\r\nMeasure the queries and timings of async requests")
+
+        node = await Tree.objects.acreate(value="Node 1")
+        await Tree.objects.acreate(value="Child Node", parent=node)
+        url = reverse("async-get-subtree", kwargs={"node_id": int(node.id)})
+
+        with self.assertLogs("tree_api.timing", "INFO") as logs:
+            response = await self.async_client.get(url)
+        metrics = response["Server-Timing"].split(", ")
+        self.assertRegex(metrics[0], r'^db;dur=[\d.]+;desc="2 queries"$')
+        self.assertRegex(metrics[1], r"^serialize;dur=[\d.]+$")
+        self.assertEqual(json.loads(logs.records[0].getMessage())["queries"], 2)
+
+    def test_generate_tree_and_benchmark(self):
+        print("\r\nGenerate a synthetic tree and benchmark every endpoint on it")
+
+        out = StringIO()
+        call_command("generate_tree", nodes=1000, deleted_ratio=0.2, seed=1, stdout=out)
+        self.assertIn("Generated 1000 nodes", out.getvalue())
+        self.assertEqual(Tree.objects.count(), 1000)
+        self.assertEqual(Tree.objects.aggregate(Max("depth"))["depth__max"], 9)
+        deleted = Tree.objects.filter(deleted=True).count()
+        self.assertGreaterEqual(deleted, 200)
+        self.assertLess(deleted, 300)
+        self.assertFalse(
+            Tree.objects.filter(deleted=False, parent__deleted=True).exists()
+        )
+
+        call_command("generate_tree", fanout="3,2", stdout=out)
+        self.assertEqual(Tree.objects.count(), 10)
+        with self.assertRaises(CommandError):
+            call_command("generate_tree", nodes=10, fanout="3", stdout=out)
+
+        results = run_benchmark([10, 100], iterations=2, deleted_ratio=0.1)
+        self.assertEqual(
+            {result["endpoint"] for result in results},
+            {url.name for url in urls.urlpatterns},
+        )
+        full = [result for result in results if result["case"] == "full"]
+        self.assertEqual([result["queries"] for result in full], [2, 2])
+
+    def test_materialized_path_follows_parent(self):
+        print("\r\nKeep the materialized path in sync when a node changes parent")
+
+        node = Tree.objects.create(value="Node 1")
+        other_node = Tree.objects.create(value="Node 2")
+        child_node = Tree.objects.create(value="Child Node", parent=node)
+        grandchild_node = Tree.objects.create(
+            value="Grandchild Node", parent=child_node
+        )
+
+        self.assertEqual(grandchild_node.depth, 2)
+        self.assertEqual(grandchild_node.ancestor_ids, [node.id, child_node.id])
+        self.assertEqual(
+            list(Tree.objects.descendants_of(node)), [child_node, grandchild_node]
+        )
+
+        url = reverse("change-node-value", kwargs={"node_id": int(child_node.id)})
+        data = {"value": "Child Node", "parent": other_node.id}
+        response = self.client.put(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        grandchild_node.refresh_from_db()
+        self.assertEqual(grandchild_node.ancestor_ids, [other_node.id, child_node.id])
+        self.assertFalse(Tree.objects.descendants_of(node).exists())
+
+        other_node.parent = grandchild_node
+        with self.assertRaises(ValidationError):
+            other_node.save()
+
+        # A copy refreshed after the move saves as a plain update.
+        stale = Tree.objects.get(pk=child_node.pk)
+        Tree.objects.move(Tree.objects.get(pk=child_node.pk), node)
+        stale.refresh_from_db()
+        stale.value = "Renamed"
+        stale.save()
+        self.assertEqual(Tree.objects.get(pk=node.pk).child_count, 1)
+        self.assertEqual(Tree.objects.get(pk=other_node.pk).child_count, 0)
+
+        # An empty `update_fields` saves nothing, as in Django.
+        stale.value = "Unsaved"
+        with self.assertNumQueries(0):
+            stale.save(update_fields=[])
+        self.assertEqual(Tree.objects.get(pk=stale.pk).value, "Renamed")
+
+    @override_settings(TREE_API_CLOSURE_TABLE=True)
+    def test_closure_table(self):
+        print("\r\nKeep the closure table in sync and read subtrees from it")
+
+        def closure_rows():
+            return set(
+                TreeClosure.objects.values_list("ancestor", "descendant", "depth")
+            )
+
+        def expected_rows():
+            return {
+                (ancestor_id, node.id, node.depth - depth)
+                for node in Tree.objects.all()
+                for depth, ancestor_id in enumerate([*node.ancestor_ids, node.id])
+            }
+
+        self.client.post(
+            reverse("reset-tree"), {"fanout": 3, "depth": 3}, format="json"
+        )
+        self.assertEqual(closure_rows(), expected_rows())
+
+        node = Tree.objects.get(value="node1")
+        url = reverse("create-subnode", kwargs={"node_parent_id": int(node.id)})
+        self.client.post(url, {"value": "New Node"}, format="json")
+        url = reverse("add-subtree", kwargs={"node_parent_id": int(node.id)})
+        subtree = {"value": "a", "children": [{"value": "b"}]}
+        self.client.post(url, subtree, format="json")
+        self.assertEqual(closure_rows(), expected_rows())
+
+        moved = Tree.objects.get(value="node1.1")
+        url = reverse("change-node-value", kwargs={"node_id": int(moved.id)})
+        parent = Tree.objects.get(value="node2.1")
+        data = {"value": "node1.1", "parent": parent.id}
+        self.client.put(url, data, format="json")
+        self.assertEqual(closure_rows(), expected_rows())
+
+        url = reverse("delete-node", kwargs={"node_id": int(parent.id)})
+        self.client.delete(url)
+        self.assertEqual(
+            set(Tree.objects.filter(deleted=True)),
+            {*Tree.objects.descendants_of(parent), parent},
+        )
+
+        url = reverse("get-subtree", kwargs={"node_id": int(node.id)})
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        get_cache().clear()
+        with self.settings(TREE_API_CLOSURE_TABLE=False):
+            self.assertEqual(response.json(), self.client.get(url).json())
+
+        TreeClosure.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_closure", stdout=out)
+        self.assertIn(f"with {len(expected_rows())} rows", out.getvalue())
+        self.assertEqual(closure_rows(), expected_rows())
+
+        self.client.post(reverse("reset-tree"), {}, format="json")
+        self.assertEqual(closure_rows(), expected_rows())
+
+    def test_obtain_ancestors(self):
+        print("\r\nObtain the chain of ancestors of a node in constant queries")
+
+        self.client.post(
+            reverse("reset-tree"), {"fanout": 3, "depth": 4}, format="json"
+        )
+        node = Tree.objects.get(value="node1.2.3")
+        Tree.objects.soft_delete(Tree.objects.get(value="node1.2.1"))
+        url = reverse("get-ancestors", kwargs={"node_id": int(node.id)})
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        chain = response.json()["ancestors"]
+        self.assertEqual(
+            [data["value"] for data in chain], ["root", "node1", "node1.2", "node1.2.3"]
+        )
+        self.assertEqual(chain[-1], node.to_dict())
+        self.assertEqual(chain[1], Tree.objects.get(value="node1").to_dict())
+
+        with self.assertNumQueries(2):
+            response = self.client.get(f"{url}?siblings=true")
+        chain = response.json()["ancestors"]
+        self.assertEqual(
+            [[sibling["value"] for sibling in data["siblings"]] for data in chain],
+            [
+                [],
+                ["node2", "node3"],
+                ["node1.1", "node1.3"],
+                ["node1.2.1", "node1.2.2"],
+            ],
+        )
+        self.assertTrue(chain[-1]["siblings"][0]["deleted"])
+
+        root = Tree.objects.get(value="root")
+        url = reverse("get-ancestors", kwargs={"node_id": int(root.id)})
+        with self.assertNumQueries(1):
+            response = self.client.get(f"{url}?siblings=true")
+        self.assertEqual(
+            response.json()["ancestors"], [{**root.to_dict(), "siblings": []}]
+        )
+
+        url = reverse("get-ancestors", kwargs={"node_id": 0})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        with self.assertNumQueries(0):
+            node.to_dict()
+
+    def test_move_node(self):
+        print("\r\nMove a branch under another parent in constant queries")
+
+        self.client.post(
+            reverse("reset-tree"), {"fanout": 3, "depth": 4}, format="json"
+        )
+        node = Tree.objects.get(value="node1.2")
+        parent = Tree.objects.get(value="node3.1")
+        url = reverse("move-node", kwargs={"node_id": int(node.id)})
+
+        with self.assertNumQueries(12):
+            response = self.client.put(url, {"parent": parent.id}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["parent"], parent.id)
+
+        leaf = Tree.objects.get(value="node1.2.1.1")
+        self.assertEqual(leaf.depth, 5)
+        self.assertEqual(
+            [Tree.objects.get(pk=pk).value for pk in leaf.ancestor_ids],
+            ["root", "node3", "node3.1", "node1.2", "node1.2.1"],
+        )
+        self.assertEqual(Tree.objects.get(value="node1").child_count, 2)
+        self.assertEqual(Tree.objects.get(value="node3.1").child_count, 4)
+
+        # Cycles, depth limit, deleted parents and unknown nodes.
+        response = self.client.put(url, {"parent": leaf.id}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        chain = Tree.objects.create(value="chain")
+        for _ in range(7):
+            chain = Tree.objects.create(value="chain", parent=chain)
+        response = self.client.put(url, {"parent": chain.id}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        deleted = Tree.objects.get(value="node2")
+        Tree.objects.soft_delete(deleted)
+        response = self.client.put(url, {"parent": deleted.id}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for data in (
+            {},
+            {"parent": True},
+            {"parent": "1"},
+            {"parent": 10**30},
+            [parent.id],
+        ):
+            response = self.client.put(url, data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(url, {"parent": 0}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Tree.objects.get(pk=node.id).parent_id, parent.id)
+
+        response = self.client.put(url, {"parent": None}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        leaf.refresh_from_db()
+        self.assertEqual(leaf.depth, 2)
+        self.assertEqual(Tree.objects.get(value="node3.1").child_count, 3)
+
+        root = Tree.objects.get(value="root")
+        self.client.get(reverse("get-subtree", kwargs={"node_id": int(root.id)}))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(url, {"parent": root.id}, format="json")
+        response = self.client.get(
+            reverse("get-subtree", kwargs={"node_id": int(root.id)})
+        )
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIn(node.id, [child["id"] for child in response.json()["children"]])
+
+    def test_search_nodes(self):
+        print("\r\nSearch nodes by value with their ancestors in constant queries")
+
+        self.client.post(
+            reverse("reset-tree"), {"fanout": 3, "depth": 3}, format="json"
+        )
+        Tree.objects.filter(value="node2.1.3").update(value="Node 2.1.3")
+        Tree.objects.soft_delete(Tree.objects.get(value="node3.1"))
+        url = reverse("search-nodes")
+
+        def search(query, queries=2):
+            with self.assertNumQueries(queries):
+                response = self.client.get(url + query)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return response.json()
+
+        page = search("?q=node1.2&mode=exact")
+        [result] = page["results"]
+        self.assertEqual(
+            [ancestor["value"] for ancestor in result["ancestors"]], ["root", "node1"]
+        )
+        self.assertEqual(
+            {key: result[key] for key in ("id", "value", "deleted", "parent")},
+            Tree.objects.get(value="node1.2").to_dict(),
+        )
+
+        page = search("?q=node1.&mode=prefix")
+        self.assertEqual(len(page["results"]), 12)
+        self.assertTrue(
+            all(node["value"].startswith("node1.") for node in page["results"])
+        )
+
+        values = {node["value"] for node in search("?q=.1.3")["results"]}
+        self.assertEqual(values, {"node1.1.3", "Node 2.1.3", "node3.1.3"})
+        values = {node["value"] for node in search("?q=NODE 2")["results"]}
+        self.assertEqual(values, {"Node 2.1.3"})
+        values = {
+            node["value"] for node in search("?q=.1.3&include_deleted=false")["results"]
+        }
+        self.assertEqual(values, {"node1.1.3", "Node 2.1.3"})
+
+        # Shorter than a trigram.
+        node = Tree.objects.get(value="node1")
+        page = search(f"?q=.3&under={node.id}", queries=3)
+        self.assertEqual(
+            [node["value"] for node in page["results"]],
+            [
+                "node1.3",
+                "node1.1.3",
+                "node1.2.3",
+                "node1.3.1",
+                "node1.3.2",
+                "node1.3.3",
+            ],
+        )
+
+        # Pages of 5 nodes, in id order.
+        page = search("?q=node&mode=prefix&limit=5")
+        ids = [node["id"] for node in page["results"]]
+        while page["next"]:
+            page = search(f"?q=node&mode=prefix&limit=5&after={page['next']}")
+            ids.extend(node["id"] for node in page["results"])
+        # Prefix matches are case sensitive, unlike `startswith` on SQLite.
+        self.assertEqual(
+            ids,
+            [
+                node.id
+                for node in Tree.objects.order_by("id")
+                if node.value.startswith("node")
+            ],
+        )
+
+        # The trigram index follows renames and deletions.
+        Tree.objects.filter(value="node1.1.3").update(value="renamed")
+        Tree.objects.filter(value="node3.1.3").delete()
+        values = {node["value"] for node in search("?q=.1.3")["results"]}
+        self.assertEqual(values, {"Node 2.1.3"})
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(f"{url}?q=node&mode=regex").status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        self.assertEqual(
+            self.client.get(f"{url}?q=node&under=0").status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+        self.assertEqual(
+            self.client.get(f"{url}?q=node&under={10**30}").status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    @override_settings(TREE_API_CHANGE_LOG=True, TREE_API_CHANGE_LOG_RETENTION=5)
+    def test_changes_feed(self):
+        print("\r\nFollow the writes to the tree through the change log")
+
+        url = reverse("changes")
+        cursor = self.client.get(url).json()["cursor"]
+
+        def changes(since):
+            response = self.client.get(f"{url}?since={since}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return response.json()
+
+        response = self.client.post(
+            reverse("reset-tree"), {"fanout": 2, "depth": 2}, format="json"
+        )
+        feed = changes(cursor)
+        self.assertEqual(
+            [change["action"] for change in feed["changes"]], ["clear", "create"]
+        )
+        self.assertEqual(len(feed["changes"][1]["nodes"]), 7)
+        cursor = feed["cursor"]
+
+        node = Tree.objects.get(value="node1")
+        url_create = reverse("create-subnode", kwargs={"node_parent_id": int(node.id)})
+        child = self.client.post(
+            url_create, {"value": "New Node"}, format="json"
+        ).json()
+        url_change = reverse("change-node-value", kwargs={"node_id": int(node.id)})
+        self.client.put(url_change, {"value": "Renamed"}, format="json")
+        self.client.delete(reverse("delete-node", kwargs={"node_id": int(node.id)}))
+        self.client.put(
+            reverse("restore-deleted-node", kwargs={"node_id": int(node.id)}),
+            format="json",
+        )
+        with self.assertNumQueries(2):
+            feed = changes(cursor)
+        self.assertEqual(
+            feed["changes"],
+            [
+                {
+                    "id": cursor + 1,
+                    "action": "create",
+                    "node": child["id"],
+                    "nodes": [[child["id"], "New Node", False, node.id]],
+                },
+                {
+                    "id": cursor + 2,
+                    "action": "update",
+                    "node": node.id,
+                    "nodes": [[node.id, "Renamed", False, node.parent_id]],
+                },
+                {
+                    "id": cursor + 3,
+                    "action": "soft_delete",
+                    "node": node.id,
+                    "cascade": True,
+                },
+                {
+                    "id": cursor + 4,
+                    "action": "restore",
+                    "node": node.id,
+                    "cascade": True,
+                },
+            ],
+        )
+        self.assertEqual(feed["cursor"], cursor + 4)
+        self.assertFalse(feed["more"])
+        self.assertEqual(changes(feed["cursor"])["changes"], [])
+        page = self.client.get(f"{url}?since={cursor}&limit=3").json()
+        self.assertEqual(page["cursor"], cursor + 3)
+        self.assertTrue(page["more"])
+
+        # A failed write leaves no entry.
+        url_add = reverse("add-subtree", kwargs={"node_parent_id": int(node.id)})
+        self.client.post(url_add, {"children": [{}]}, format="json")
+        self.assertEqual(changes(cursor + 4)["changes"], [])
+
+        logged = TreeChange.objects.count()
+        self.assertEqual(prune_changes(), logged - 5)
+        self.assertEqual(TreeChange.objects.count(), 5)
+        response = self.client.get(f"{url}?since={cursor - 2}")
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        response = self.client.get(f"{url}?since={10**30}")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(changes(cursor)["changes"]), 4)
+
+    @override_settings(TREE_API_CLOSURE_TABLE=True, TREE_API_CHANGE_LOG=True)
+    def test_purge_deleted_nodes(self):
+        print("\r\nPurge old deleted branches in batches from the leaves upward")
+
+        self.client.post(
+            reverse("reset-tree"), {"fanout": 3, "depth": 3}, format="json"
+        )
+        node = Tree.objects.get(value="node1")
+        Tree.objects.soft_delete(node)
+        # Created under a deleted branch, it keeps its ancestors from being purged.
+        live = Tree.objects.create(
+            value="Live Node", parent=Tree.objects.get(value="node1.1")
+        )
+        recent = Tree.objects.create(
+            value="Recent Node", parent=Tree.objects.get(value="node2")
+        )
+        Tree.objects.soft_delete(recent)
+        Tree.objects.subtree_of(node).filter(deleted=True).update(
+            deleted_at=timezone.now() - timedelta(days=40)
+        )
+        root = Tree.objects.get(value="root")
+        revision = root.revision
+
+        # The leaves, both DELETEs, both UPDATEs and the change log, in a savepoint.
+        with self.assertNumQueries(8):
+            self.assertEqual(
+                Tree.objects.purge_batch(timezone.now() - timedelta(days=30), 4), 4
+            )
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("purge_deleted", batch_size=4, stdout=out)
+        self.assertIn("Purged 7 nodes in 3 batches.", out.getvalue())
+        for days in (-1, 1e6, float("nan")):
+            with self.assertRaises(CommandError):
+                call_command("purge_deleted", days=days, stdout=out)
+
+        self.assertEqual(
+            set(Tree.objects.filter(deleted=True).values_list("value", flat=True)),
+            {"node1", "node1.1", "Recent Node"},
+        )
+        self.assertEqual(Tree.objects.get(value="node1").child_count, 1)
+        self.assertEqual(Tree.objects.get(value="node1.1").child_count, 1)
+        self.assertGreater(Tree.objects.get(pk=root.id).revision, revision)
+        self.assertFalse(
+            TreeClosure.objects.exclude(descendant__in=Tree.objects.all()).exists()
+        )
+        self.assertEqual(TreeChange.objects.filter(action="purge").count(), 4)
+        self.assertTrue(Tree.objects.filter(pk=live.pk).exists())
+
+        url = reverse("get-subtree", kwargs={"node_id": int(root.id)})
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("purge-deleted"), {"older_than_days": 0}, format="json"
+            )
+        self.assertEqual(response.json(), {"purged": 1, "batches": 1, "done": True})
+        self.assertFalse(Tree.objects.filter(pk=recent.pk).exists())
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+
+        for data in (
+            {"older_than_days": "soon"},
+            {"older_than_days": True},
+            {"older_than_days": -1},
+            {"older_than_days": 1e12},
+            [0],
+        ):
+            response = self.client.post(reverse("purge-deleted"), data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,223 @@
+import time
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Max
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from .cache import get_cache
+from .models import MAX_DEPTH, Tree, TreeClosure
+from .utils import fanout_for_size, generate_tree, purge_deleted
+
+
+class QueryBudgetTests:
+    """
+    Query budgets of every endpoint against a generated tree of `size` nodes, 10 levels deep.
+
+    The budgets are the same for every tree size: each endpoint runs a constant number of
+    queries, or one per level where it walks the tree level by level, never one per node.
+    `time_limit` is the wall-clock ceiling, in seconds, of the requests that touch the whole
+    tree.
+    """
+
+    size = None
+    time_limit = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tree = generate_tree(fanout_for_size(cls.size), cls.size, 0.1, seed=0)
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+        self.root = Tree.objects.get(pk=self.tree["root"])
+        self.node = Tree.objects.filter(parent=self.root).order_by("id").first()
+
+    def get_subtree(self, query="", node=None):
+        node = node or self.root
+        url = reverse("get-subtree", kwargs={"node_id": int(node.id)})
+        response = self.client.get(url + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response
+
+    def assertFasterThan(self, seconds, request, *args):
+        started = time.perf_counter()
+        request(*args)
+        self.assertLess(time.perf_counter() - started, seconds)
+
+    def test_get_subtree_budget(self):
+        print(f"\r\nGet a subtree of {self.size} nodes in constant queries")
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_subtree()["X-Cache"], "MISS")
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_subtree()["X-Cache"], "HIT")
+        get_cache().clear()
+        self.assertFasterThan(self.time_limit, self.get_subtree)
+
+    def test_get_subtree_variants_budget(self):
+        print(f"\r\nGet pages, flat and streamed subtrees of {self.size} nodes")
+
+        with self.assertNumQueries(2):
+            self.get_subtree("?format=flat")
+        with self.assertNumQueries(2):
+            self.get_subtree("?stream=1")
+        # The node, then one query per level.
+        with self.assertNumQueries(1 + 2):
+            self.get_subtree("?max_depth=2&children_limit=5")
+        # The traversal stops early when every branch of a level is deleted.
+        with CaptureQueriesContext(connection) as queries:
+            self.get_subtree("?include_deleted=false")
+        self.assertLessEqual(len(queries), 1 + MAX_DEPTH)
+
+        self.assertFasterThan(self.time_limit, self.get_subtree, "?stream=1")
+        self.assertFasterThan(
+            self.time_limit, self.get_subtree, "?include_deleted=false&max_depth=9"
+        )
+
+    def test_get_ancestors_budget(self):
+        print(f"\r\nGet the ancestors of a node of a tree of {self.size} nodes")
+
+        node = Tree.objects.order_by("-depth", "id").first()
+        url = reverse("get-ancestors", kwargs={"node_id": int(node.id)})
+        with self.assertNumQueries(2):
+            response = self.client.get(url + "?siblings=true")
+        self.assertEqual(len(response.json()["ancestors"]), node.depth + 1)
+
+    def test_search_budget(self):
+        print(f"\r\nSearch the values of a tree of {self.size} nodes")
+
+        url = reverse("search-nodes")
+        for query in ("?q=node1.1&mode=prefix", "?q=.1.1", "?q=.1"):
+            with self.assertNumQueries(2):
+                response = self.client.get(url + query)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(3):
+            self.client.get(f"{url}?q=.1.1&under={self.node.id}")
+        self.assertFasterThan(self.time_limit, self.client.get, url + "?q=.1.1")
+
+    def test_write_budget(self):
+        print(f"\r\nWrite nodes of a tree of {self.size} nodes in constant queries")
+
+        url = reverse("create-subnode", kwargs={"node_parent_id": int(self.root.id)})
+        with self.assertNumQueries(7):
+            self.client.post(url, {"value": "New Node"}, format="json")
+
+        url = reverse("change-node-value", kwargs={"node_id": int(self.node.id)})
+        with self.assertNumQueries(5):
+            self.client.put(url, {"value": "New Value"}, format="json")
+
+        url = reverse("add-subtree", kwargs={"node_parent_id": int(self.root.id)})
+        subtree = {"value": "a", "children": [{"value": "b"}, {"value": "c"}]}
+        # One insert per level of the new subtree.
+        with self.assertNumQueries(7):
+            response = self.client.post(url, subtree, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_move_budget(self):
+        print(f"\r\nMove a branch of a tree of {self.size} nodes in constant queries")
+
+        parent = Tree.objects.create(value="New Parent")
+        url = reverse("move-node", kwargs={"node_id": int(self.node.id)})
+        started = time.perf_counter()
+        with self.assertNumQueries(12):
+            response = self.client.put(url, {"parent": parent.id}, format="json")
+        self.assertLess(time.perf_counter() - started, self.time_limit)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.path, parent.subtree_path)
+        self.assertFalse(
+            Tree.objects.descendants_of(self.node)
+            .exclude(path__startswith=parent.subtree_path)
+            .exists()
+        )
+        self.assertEqual(
+            Tree.objects.descendants_of(self.node).aggregate(Max("depth"))[
+                "depth__max"
+            ],
+            MAX_DEPTH - 1,
+        )
+
+    @override_settings(TREE_API_CLOSURE_TABLE=True)
+    def test_move_with_closure_budget(self):
+        print(
+            f"\r\nMove a branch of a tree of {self.size} nodes and its closure rows in "
+            f"constant queries"
+        )
+
+        TreeClosure.objects.rebuild()
+        parent = Tree.objects.create(value="New Parent")
+        url = reverse("move-node", kwargs={"node_id": int(self.node.id)})
+        # The closure rows add one DELETE and one INSERT ... SELECT.
+        with self.assertNumQueries(12 + 2):
+            response = self.client.put(url, {"parent": parent.id}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The relinked rows are exactly the ones rebuilt from the parent pointers.
+        rows = set(TreeClosure.objects.values_list("ancestor", "descendant", "depth"))
+        TreeClosure.objects.rebuild()
+        self.assertEqual(
+            set(TreeClosure.objects.values_list("ancestor", "descendant", "depth")),
+            rows,
+        )
+        self.assertEqual(
+            TreeClosure.objects.filter(ancestor=parent).count(),
+            Tree.objects.descendants_of(self.node).count() + 2,
+        )
+
+    def test_purge_budget(self):
+        print(
+            f"\r\nPurge the deleted branches of a tree of {self.size} nodes in batches"
+        )
+
+        Tree.objects.filter(deleted=True).update(
+            deleted_at=timezone.now() - timedelta(days=1)
+        )
+        # The leaves, both DELETEs and both UPDATEs, in a savepoint.
+        with self.assertNumQueries(7):
+            Tree.objects.purge_batch(timezone.now(), batch_size=100)
+        self.assertFasterThan(self.time_limit, purge_deleted, timedelta(0))
+        self.assertFalse(Tree.objects.filter(deleted=True).exists())
+
+    def test_delete_and_restore_budget(self):
+        print(
+            f"\r\nDelete and restore a branch of {self.size} nodes in constant queries"
+        )
+
+        url = reverse("delete-node", kwargs={"node_id": int(self.node.id)})
+        started = time.perf_counter()
+        with self.assertNumQueries(5):
+            response = self.client.delete(url)
+        self.assertLess(time.perf_counter() - started, self.time_limit)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        url = reverse("restore-deleted-node", kwargs={"node_id": int(self.node.id)})
+        started = time.perf_counter()
+        with self.assertNumQueries(5):
+            response = self.client.put(url, format="json")
+        self.assertLess(time.perf_counter() - started, self.time_limit)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(
+            Tree.objects.descendants_of(self.node).filter(deleted=True).exists()
+        )
+
+
+class SmallTreeQueryBudgetTests(QueryBudgetTests, TestCase):
+    size = 10
+    time_limit = 0.5
+
+
+class MediumTreeQueryBudgetTests(QueryBudgetTests, TestCase):
+    size = 1_000
+    time_limit = 1.0
+
+
+class LargeTreeQueryBudgetTests(QueryBudgetTests, TestCase):
+    size = 10_000
+    time_limit = 3.0
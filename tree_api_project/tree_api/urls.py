@@ -1,26 +1,40 @@
 from django.urls import path
 from .views import (
     get_subtree,
+    get_ancestors,
+    search_nodes,
+    get_changes,
+    get_subtree_cache_stats,
     add_node,
+    add_subtree,
     create_subnode,
     reset_tree,
     change_node_value,
+    move_node,
     restore_deleted_node,
     delete_node,
+    purge_deleted_nodes,
 )
 
 urlpatterns = [
     path("get-subtree/<int:node_id>/", get_subtree, name="get-subtree"),
+    path("get-ancestors/<int:node_id>/", get_ancestors, name="get-ancestors"),
+    path("search/", search_nodes, name="search-nodes"),
+    path("changes/", get_changes, name="changes"),
+    path("subtree-cache-stats/", get_subtree_cache_stats, name="subtree-cache-stats"),
     path("add-node/", add_node, name="add-node"),
     path("create-subnode/<int:node_parent_id>/", create_subnode, name="create-subnode"),
+    path("add-subtree/<int:node_parent_id>/", add_subtree, name="add-subtree"),
     path("reset-tree/", reset_tree, name="reset-tree"),
     path(
         "change-node-value/<int:node_id>/", change_node_value, name="change-node-value"
     ),
+    path("move-node/<int:node_id>/", move_node, name="move-node"),
     path(
         "restore-deleted-node/<int:node_id>/",
         restore_deleted_node,
         name="restore-deleted-node",
     ),
     path("delete-node/<int:node_id>/", delete_node, name="delete-node"),
+    path("purge-deleted/", purge_deleted_nodes, name="purge-deleted"),
 ]
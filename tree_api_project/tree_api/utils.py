@@ -0,0 +1,768 @@
+import json
+import random
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+
+from .middleware import timing
+from .models import MAX_CHILDREN, MAX_DEPTH, Tree, path_ids, path_segment
+from .renderers import FLAT_FORMATS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+TRUE_VALUES = {"1", "true", "yes", "on"}
+
+# The largest integer a database column holds, larger ids and cursors cannot match anything.
+MAX_INTEGER = 2**63 - 1
+
+# Fan-out of each level below the root in the default tree: 1 + 9 + 27 + 81 + 243 nodes.
+DEFAULT_TREE_FANOUT = [9, 3, 3, 3]
+MAX_RESET_NODES = 100_000
+
+# Older thresholds reach before the earliest datetime.
+MAX_PURGE_AFTER_DAYS = 36_500
+
+STREAM_CHUNK_SIZE = 2000
+STREAM_BUFFER_SIZE = 64 * 1024
+
+# Columns read for every node of a subtree response, in the order of `serialize_node`.
+NODE_COLUMNS = ("id", "value", "deleted", "parent_id")
+
+
+def query_flag(request, name, default=False):
+    """
+    The function `query_flag` reads a boolean flag such as `?cascade=true` from the query string.
+
+    :param request: The `request` parameter is the request being handled, from DRF or Django
+    :param name: The `name` parameter is the name of the query parameter
+    :param default: The `default` parameter is returned when the parameter is missing
+    :return: True when the parameter is one of "1", "true", "yes" or "on", False otherwise
+    """
+    value = request.GET.get(name)
+    if value is None:
+        return default
+    return value.lower() in TRUE_VALUES
+
+
+def query_int(request, name, minimum=0, maximum=MAX_INTEGER):
+    """
+    The function `query_int` reads an optional integer such as `?max_depth=2` from the query string.
+
+    :param request: The `request` parameter is the request being handled, from DRF or Django
+    :param name: The `name` parameter is the name of the query parameter
+    :param minimum: The `minimum` parameter is the smallest accepted value
+    :param maximum: The `maximum` parameter is the largest accepted value
+    :return: the integer, or None when the parameter is missing
+    """
+    value = request.GET.get(name)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError(f"`{name}` must be an integer.")
+    if value < minimum:
+        raise ValidationError(f"`{name}` must be at least {minimum}.")
+    if value > maximum:
+        raise ValidationError(f"`{name}` must be at most {maximum}.")
+    return value
+
+
+def requested_format(request):
+    """
+    The function `requested_format` returns the format negotiated by DRF for `request`, such as
+    "json" or "flat". Plain Django requests, as handled by the async views, are always "json".
+
+    :param request: The `request` parameter is the request being answered
+    :return: the format of the accepted renderer
+    """
+    renderer = getattr(request, "accepted_renderer", None)
+    return getattr(renderer, "format", "json")
+
+
+def subtree_etag(request, node_id, version):
+    """
+    The function `subtree_etag` builds a strong ETag for the subtree of a node from a version that
+    changes whenever the node or one of its descendants changes, such as the stored revision of the
+    node, so the subtree never has to be loaded or serialized to compute it.
+
+    :param request: The `request` parameter is the request being answered. Its query string and its
+    negotiated format are part of the ETag, as they select a different representation of the same
+    subtree
+    :param node_id: The `node_id` parameter is the id of the node at the top of the subtree
+    :param version: The `version` parameter is the revision of the node, or the generation of the
+    in-memory index the subtree is read from
+    :return: the quoted ETag
+    """
+    etag = f"{node_id}.{version}"
+    renderer_format = requested_format(request)
+    if renderer_format in FLAT_FORMATS:
+        etag += f".{renderer_format}"
+    variant = request.GET.urlencode()
+    if variant:
+        etag += f".{zlib.crc32(variant.encode()):08x}"
+    return f'"{etag}"'
+
+
+def etag_matches(request, etag):
+    """
+    The function `etag_matches` tells whether the `If-None-Match` header of the request matches
+    `etag`, so a 304 (NOT MODIFIED) can be returned.
+
+    :param request: The `request` parameter is the request being answered
+    :param etag: The `etag` parameter is the quoted ETag of the current representation
+    :return: True if the client already holds the current representation
+    """
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    etags = [tag.removeprefix("W/") for tag in parse_etags(header)]
+    return "*" in etags or etag in etags
+
+
+def serialize_node(node_id, value, deleted, parent_id):
+    """
+    The function `serialize_node` builds the dict of a node in a subtree response, with the same keys
+    and order as `TreeSerializer`, from a row of `NODE_COLUMNS`. It is much cheaper than running a DRF
+    serializer per node, which is only needed to validate input.
+
+    :return: a dict with the `id`, `value`, `deleted` and `parent` of the node
+    """
+    return {"id": node_id, "value": value, "deleted": deleted, "parent": parent_id}
+
+
+def load_subtree(node):
+    """
+    The function `load_subtree` fetches a node and all its descendants and returns them as a nested
+    dict, with the same shape as `TreeSerializer` output plus a `children` list on every node.
+
+    All the descendants are read with a single range scan on the indexed `path` column, so the
+    subtree costs one query no matter how many nodes it holds.
+
+    :param node: The `node` parameter is the `Tree` instance at the top of the subtree
+    :return: a dict with the serialized node and its nested `children`
+    """
+    rows = Tree.objects.descendants_of(node).order_by("depth", "id")
+    nodes = [serialize_node(node.id, node.value, node.deleted, node.parent_id)]
+    nodes.extend(serialize_node(*row) for row in rows.values_list(*NODE_COLUMNS))
+
+    return build_subtree(nodes, node.id)
+
+
+async def aload_subtree(node):
+    """
+    The function `aload_subtree` is the async version of `load_subtree`, reading the descendants
+    with the async ORM.
+
+    :param node: The `node` parameter is the `Tree` instance at the top of the subtree
+    :return: a dict with the serialized node and its nested `children`
+    """
+    rows = Tree.objects.descendants_of(node).order_by("depth", "id")
+    nodes = [serialize_node(node.id, node.value, node.deleted, node.parent_id)]
+    nodes.extend(
+        [serialize_node(*row) async for row in rows.values_list(*NODE_COLUMNS)]
+    )
+
+    return build_subtree(nodes, node.id)
+
+
+def load_subtree_page(
+    node, max_depth=None, children_limit=None, after=None, include_deleted=True
+):
+    """
+    The function `load_subtree_page` fetches the top of a subtree: at most `max_depth` levels below
+    `node`, and at most `children_limit` children per node, starting after the child id `after` for
+    the children of `node` itself. Without `include_deleted`, deleted nodes are filtered out of every
+    level in the query, so their whole branch is pruned without being read, through the `(parent,
+    deleted)` index.
+
+    Nodes whose children were cut off carry `has_more: true` and their total `child_count`, so the
+    client can expand them later with another request on that node. Every level is one query that
+    keeps the first children of each parent with a window function, so the cost is bounded by the
+    requested depth and limit, not by the size of the subtree.
+
+    :param node: The `node` parameter is the `Tree` instance at the top of the subtree
+    :param max_depth: The `max_depth` parameter is the number of levels to return below `node`
+    :param children_limit: The `children_limit` parameter is the number of children returned per node
+    :param after: The `after` parameter is the id of the last child of `node` already received
+    :param include_deleted: The `include_deleted` parameter tells whether deleted nodes and their
+    descendants are returned
+    :return: a dict with the serialized node and its nested `children`
+    """
+    nodes = [serialize_node(node.id, node.value, node.deleted, node.parent_id)]
+    child_count = {node.id: node.child_count}
+    has_more = set()
+
+    level = [node.id]
+    depth = 0
+    while level and (max_depth is None or depth < max_depth):
+        rows = _page_level_rows(level, depth, children_limit, after, include_deleted)
+        level = _add_page_level(rows, children_limit, nodes, child_count, has_more)
+        depth += 1
+
+    return _build_subtree_page(
+        node, nodes, child_count, has_more, level if max_depth is not None else []
+    )
+
+
+async def aload_subtree_page(
+    node, max_depth=None, children_limit=None, after=None, include_deleted=True
+):
+    """
+    The function `aload_subtree_page` is the async version of `load_subtree_page`, reading every
+    level with the async ORM.
+
+    :param node: The `node` parameter is the `Tree` instance at the top of the subtree
+    :param max_depth: The `max_depth` parameter is the number of levels to return below `node`
+    :param children_limit: The `children_limit` parameter is the number of children returned per node
+    :param after: The `after` parameter is the id of the last child of `node` already received
+    :param include_deleted: The `include_deleted` parameter tells whether deleted nodes and their
+    descendants are returned
+    :return: a dict with the serialized node and its nested `children`
+    """
+    nodes = [serialize_node(node.id, node.value, node.deleted, node.parent_id)]
+    child_count = {node.id: node.child_count}
+    has_more = set()
+
+    level = [node.id]
+    depth = 0
+    while level and (max_depth is None or depth < max_depth):
+        rows = _page_level_rows(level, depth, children_limit, after, include_deleted)
+        rows = [row async for row in rows]
+        level = _add_page_level(rows, children_limit, nodes, child_count, has_more)
+        depth += 1
+
+    return _build_subtree_page(
+        node, nodes, child_count, has_more, level if max_depth is not None else []
+    )
+
+
+def _page_level_rows(level, depth, children_limit, after, include_deleted):
+    children = Tree.objects.filter(parent_id__in=level)
+    if not include_deleted:
+        children = children.filter(deleted=False)
+    columns = [*NODE_COLUMNS, "child_count"]
+    if depth == 0 and after is not None:
+        children = children.filter(id__gt=after)
+    if children_limit is not None:
+        # One extra child per parent tells whether the parent has more children.
+        children = children.annotate(
+            position=Window(
+                RowNumber(), partition_by=[F("parent_id")], order_by=F("id").asc()
+            )
+        ).filter(position__lte=children_limit + 1)
+        columns.append("position")
+    return children.order_by("parent_id", "id").values_list(*columns)
+
+
+def _add_page_level(rows, children_limit, nodes, child_count, has_more):
+    level = []
+    for row in rows:
+        if children_limit is not None and row[5] > children_limit:
+            has_more.add(row[3])
+            continue
+        nodes.append(serialize_node(*row[:4]))
+        child_count[row[0]] = row[4]
+        level.append(row[0])
+    return level
+
+
+def _build_subtree_page(node, nodes, child_count, has_more, cut_level):
+    # The nodes of the last level returned have more children when some were not read.
+    has_more.update(node_id for node_id in cut_level if child_count.get(node_id))
+    for data in nodes:
+        if data["id"] in has_more:
+            data["has_more"] = True
+            data["child_count"] = child_count[data["id"]]
+    return build_subtree(nodes, node.id)
+
+
+def load_ancestors(node, siblings=False):
+    """
+    The function `load_ancestors` returns the chain of nodes from the root of the tree down to `node`,
+    such as the breadcrumb of a UI.
+
+    The ancestors are read by primary key from the ids stored in the `path` of the node, in a single
+    query. With `siblings`, the same query also reads the children of every ancestor, and every node
+    of the chain below the root gets the other children of its parent in a `siblings` list.
+
+    :param node: The `node` parameter is the `Tree` instance at the bottom of the chain
+    :param siblings: The `siblings` parameter tells whether the siblings of every node are returned
+    :return: a list of serialized nodes, from the root to `node`
+    """
+    rows = _ancestor_rows(node, siblings)
+    return _build_chain(node, [] if rows is None else rows, siblings)
+
+
+async def aload_ancestors(node, siblings=False):
+    """
+    The function `aload_ancestors` is the async version of `load_ancestors`, reading the ancestors
+    with the async ORM.
+
+    :param node: The `node` parameter is the `Tree` instance at the bottom of the chain
+    :param siblings: The `siblings` parameter tells whether the siblings of every node are returned
+    :return: a list of serialized nodes, from the root to `node`
+    """
+    rows = _ancestor_rows(node, siblings)
+    return _build_chain(
+        node, [] if rows is None else [row async for row in rows], siblings
+    )
+
+
+def _ancestor_rows(node, siblings):
+    ancestor_ids = node.ancestor_ids
+    if not ancestor_ids:
+        return None
+    nodes = Q(pk__in=ancestor_ids)
+    if siblings:
+        nodes |= Q(parent_id__in=ancestor_ids)
+    return Tree.objects.filter(nodes).order_by("id").values_list(*NODE_COLUMNS)
+
+
+def _build_chain(node, rows, siblings):
+    ancestor_ids = node.ancestor_ids
+    chain = [serialize_node(node.id, node.value, node.deleted, node.parent_id)]
+    if not ancestor_ids:
+        if siblings:
+            chain[0]["siblings"] = []
+        return chain
+
+    ancestors = {}
+    children = {ancestor_id: [] for ancestor_id in ancestor_ids}
+    for row in rows:
+        data = serialize_node(*row)
+        if data["id"] in children:
+            ancestors[data["id"]] = data
+        if siblings and data["parent"] in children:
+            children[data["parent"]].append(data)
+
+    chain[:0] = [ancestors[ancestor_id] for ancestor_id in ancestor_ids]
+    if siblings:
+        for data in chain:
+            data["siblings"] = [
+                sibling
+                for sibling in children.get(data["parent"], [])
+                if sibling["id"] != data["id"]
+            ]
+    return chain
+
+
+def load_search_page(nodes, limit, after=None):
+    """
+    The function `load_search_page` returns one page of the nodes matched by a search, in id order,
+    each with the chain of its ancestors from the root.
+
+    The page is read with one query, and the ancestors of all its nodes with a second primary key
+    lookup on the ids stored in their `path`, so a page costs two queries whatever its size.
+
+    :param nodes: The `nodes` parameter is the queryset of the matching nodes
+    :param limit: The `limit` parameter is the maximum number of nodes in the page
+    :param after: The `after` parameter is the id of the last node of the previous page
+    :return: a dict with the serialized nodes in `results`, and in `next` the `after` of the next
+    page, or None on the last page
+    """
+    rows = list(_search_rows(nodes, limit, after))
+    ancestor_ids = {
+        ancestor_id for *_, path in rows[:limit] for ancestor_id in path_ids(path)
+    }
+    values = {}
+    if ancestor_ids:
+        values = dict(
+            Tree.objects.filter(pk__in=ancestor_ids).values_list("id", "value")
+        )
+    return _build_search_page(rows, limit, values)
+
+
+async def aload_search_page(nodes, limit, after=None):
+    """
+    The function `aload_search_page` is the async version of `load_search_page`, reading the page
+    and the ancestors of its nodes with the async ORM.
+
+    :param nodes: The `nodes` parameter is the queryset of the matching nodes
+    :param limit: The `limit` parameter is the maximum number of nodes in the page
+    :param after: The `after` parameter is the id of the last node of the previous page
+    :return: a dict with the serialized nodes in `results`, and in `next` the `after` of the next
+    page, or None on the last page
+    """
+    rows = [row async for row in _search_rows(nodes, limit, after)]
+    ancestor_ids = {
+        ancestor_id for *_, path in rows[:limit] for ancestor_id in path_ids(path)
+    }
+    values = {}
+    if ancestor_ids:
+        values = {
+            ancestor_id: value
+            async for ancestor_id, value in Tree.objects.filter(
+                pk__in=ancestor_ids
+            ).values_list("id", "value")
+        }
+    return _build_search_page(rows, limit, values)
+
+
+def _search_rows(nodes, limit, after):
+    # One more row than the page, to tell whether another page follows.
+    if after is not None:
+        nodes = nodes.filter(pk__gt=after)
+    return nodes.order_by("id").values_list(*NODE_COLUMNS, "path")[: limit + 1]
+
+
+def _build_search_page(rows, limit, values):
+    next_after = rows[limit - 1][0] if len(rows) > limit else None
+    results = []
+    for *row, path in rows[:limit]:
+        data = serialize_node(*row)
+        data["ancestors"] = [
+            {"id": ancestor_id, "value": values[ancestor_id]}
+            for ancestor_id in path_ids(path)
+        ]
+        results.append(data)
+    return {"results": results, "next": next_after}
+
+
+def build_subtree(nodes, root_id):
+    """
+    The function `build_subtree` nests a flat list of serialized nodes under their parents in O(N).
+
+    :param nodes: The `nodes` parameter is an iterable of serialized node dicts, each with `id` and
+    `parent` keys, in the order their children should be listed. A `children` list is added to them
+    in place
+    :param root_id: The `root_id` parameter is the id of the node at the top of the subtree
+    :return: the dict of the root node, with a `children` list on every node
+    """
+    by_id = {}
+    for data in nodes:
+        data["children"] = []
+        by_id[data["id"]] = data
+
+    for data in by_id.values():
+        if data["id"] != root_id and data["parent"] in by_id:
+            by_id[data["parent"]]["children"].append(data)
+
+    return by_id[root_id]
+
+
+def flatten_subtree(subtree):
+    """
+    The function `flatten_subtree` turns a nested subtree into parallel arrays in pre-order, which
+    repeat no key names and are much smaller to send than the nested dicts.
+
+    The node at index `i` has the id `ids[i]`, the value `values[i]`, is deleted when `deleted[i]`
+    is 1, and its parent is at index `parents[i]`, which always comes before `i`, or -1 for the top
+    node, so the client can rebuild the tree in a single pass. `parent` is the parent id of the top
+    node. Nodes of a page whose children were cut off are listed in `has_more` as `[index,
+    child_count]` pairs.
+
+    :param subtree: The `subtree` parameter is a nested subtree as returned by `load_subtree`
+    :return: a dict with the `parent`, `ids`, `parents`, `values` and `deleted` of the subtree
+    """
+    ids, parents, values, deleted, has_more = [], [], [], [], []
+    pending = [(subtree, -1)]
+    while pending:
+        data, parent = pending.pop()
+        index = len(ids)
+        ids.append(data["id"])
+        parents.append(parent)
+        values.append(data["value"])
+        deleted.append(int(data["deleted"]))
+        if data.get("has_more"):
+            has_more.append([index, data["child_count"]])
+        pending.extend((child, index) for child in reversed(data["children"]))
+
+    flat = {
+        "parent": subtree["parent"],
+        "ids": ids,
+        "parents": parents,
+        "values": values,
+        "deleted": deleted,
+    }
+    if has_more:
+        flat["has_more"] = has_more
+    return flat
+
+
+def tree_json_response(data, status=200, **kwargs):
+    """
+    The function `tree_json_response` returns `data` as JSON, like `JsonResponse`.
+
+    With `TREE_API_FAST_JSON` and the optional `orjson` package installed, the body is encoded with
+    orjson instead, which is several times faster on large subtrees but writes compact JSON without
+    the spaces after `,` and `:`, so it is opt-in.
+
+    :param data: The `data` parameter is the dict to encode
+    :param status: The `status` parameter is the HTTP status code of the response
+    :return: an HttpResponse with a JSON body
+    """
+    with timing("serialize"):
+        if orjson is not None and getattr(settings, "TREE_API_FAST_JSON", False):
+            return HttpResponse(
+                orjson.dumps(data),
+                content_type="application/json",
+                status=status,
+                **kwargs,
+            )
+        return JsonResponse(data, status=status, **kwargs)
+
+
+def _open_node_json(node_id, value, deleted, parent_id):
+    # Same layout as the JSON written by `JsonResponse` for the `load_subtree` dicts.
+    return (
+        f'{{"id": {node_id}, "value": {json.dumps(value)}, '
+        f'"deleted": {json.dumps(deleted)}, "parent": {json.dumps(parent_id)}, '
+        f'"children": ['
+    )
+
+
+def stream_subtree(node, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    The function `stream_subtree` yields the JSON of the subtree of `node` in chunks, with the same
+    content as `load_subtree`, without ever holding the whole subtree in memory.
+
+    The descendants are read with a server-side cursor ordered by `(path, id)`, which the `path`
+    index returns without sorting. In that order the children of every node come as one group, and
+    the groups come in the pre-order of their parents, so the nested JSON can be written while only
+    the pending siblings of each open level are kept in memory.
+
+    :param node: The `node` parameter is the `Tree` instance at the top of the subtree
+    :param chunk_size: The `chunk_size` parameter is the number of rows fetched from the database at
+    a time
+    :return: a generator of JSON text chunks
+    """
+    rows = (
+        Tree.objects.descendants_of(node)
+        .order_by("path", "id")
+        .values_list("id", "value", "deleted", "parent_id", "path")
+        .iterator(chunk_size=chunk_size)
+    )
+    pending = next(rows, None)
+
+    def read_children(subtree_path):
+        nonlocal pending
+        children = []
+        while pending is not None and pending[4] == subtree_path:
+            children.append(pending)
+            pending = next(rows, None)
+        return children
+
+    buffer = [_open_node_json(node.id, node.value, node.deleted, node.parent_id)]
+    size = 0
+    # Every open level holds the iterator over its remaining children, and whether a child
+    # was written yet.
+    stack = [[iter(read_children(node.subtree_path)), True]]
+    while stack:
+        level = stack[-1]
+        child = next(level[0], None)
+        if child is None:
+            buffer.append("]}")
+            stack.pop()
+            continue
+
+        if not level[1]:
+            buffer.append(", ")
+        level[1] = False
+        chunk = _open_node_json(*child[:4])
+        buffer.append(chunk)
+        stack.append([iter(read_children(child[4] + path_segment(child[0]))), True])
+
+        size += len(chunk)
+        if size >= STREAM_BUFFER_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+
+    yield "".join(buffer)
+
+
+def _is_int_between(value, minimum, maximum):
+    # JSON booleans are ints in Python, and floats and strings are not coerced.
+    return (
+        isinstance(value, int)
+        and not isinstance(value, bool)
+        and minimum <= value <= maximum
+    )
+
+
+def parse_tree_shape(data):
+    """
+    The function `parse_tree_shape` reads the shape of a generated tree from request data.
+
+    `fanout` is either a list with the number of children per node for every level below the
+    root, or a single number used for `depth` levels. Without any of them the default tree
+    shape is returned.
+
+    :param data: The `data` parameter is the request data, with optional `fanout` and `depth` keys
+    :return: the list of fan-outs per level below the root
+    """
+    if not isinstance(data, dict):
+        raise ValidationError("The tree shape must be an object.")
+    fanout = data.get("fanout", DEFAULT_TREE_FANOUT)
+    depth = data.get("depth")
+    if depth is not None and not _is_int_between(depth, 0, MAX_DEPTH - 1):
+        raise ValidationError(
+            f"`depth` must be an integer between 0 and {MAX_DEPTH - 1}."
+        )
+    counts = fanout if isinstance(fanout, (list, tuple)) else [fanout]
+    if not all(_is_int_between(count, 0, MAX_CHILDREN) for count in counts):
+        raise ValidationError(
+            f"`fanout` must be an integer between 0 and {MAX_CHILDREN}, or a list of them."
+        )
+
+    if isinstance(fanout, (list, tuple)):
+        if len(fanout) > MAX_DEPTH - 1:
+            raise ValidationError(f"A tree can have at most {MAX_DEPTH} levels.")
+        if depth is not None and depth != len(fanout):
+            raise ValidationError("`depth` must match the length of `fanout`.")
+        fanout = list(fanout)
+    else:
+        fanout = [fanout] * (len(DEFAULT_TREE_FANOUT) if depth is None else depth)
+
+    total, level_size = 1, 1
+    for count in fanout:
+        level_size *= count
+        total += level_size
+    if total > MAX_RESET_NODES:
+        raise ValidationError(
+            f"A generated tree can have at most {MAX_RESET_NODES} nodes."
+        )
+    return fanout
+
+
+def fanout_for_size(nodes, depth=MAX_DEPTH - 1):
+    """
+    The function `fanout_for_size` returns the smallest fan-out, the same on every level, of a tree
+    with `depth` levels below the root that holds at least `nodes` nodes.
+
+    :param nodes: The `nodes` parameter is the number of nodes the tree must hold
+    :param depth: The `depth` parameter is the number of levels below the root
+    :return: the list of fan-outs per level below the root
+    """
+    if nodes < 1:
+        raise ValidationError("A tree has at least one node.")
+    if depth > MAX_DEPTH - 1:
+        raise ValidationError(f"A tree can have at most {MAX_DEPTH} levels.")
+    for count in range(1, MAX_CHILDREN + 1):
+        if sum(count**level for level in range(depth + 1)) >= nodes:
+            return [count] * depth
+    raise ValidationError(f"A tree of {depth + 1} levels cannot hold {nodes} nodes.")
+
+
+def build_tree_specs(fanout, max_nodes=None):
+    """
+    The function `build_tree_specs` builds the nested node specs of a generated tree, named
+    "root", "node1", "node1.1", "node1.1.1" and so on.
+
+    :param fanout: The `fanout` parameter is the number of children per node for every level
+    below the root
+    :param max_nodes: The `max_nodes` parameter stops the tree at that many nodes, leaving the last
+    level partly filled
+    :return: the spec of the root node, as accepted by `Tree.objects.create_subtree`
+    """
+    root = {"value": "root", "children": []}
+    level = [root]
+    remaining = (max_nodes if max_nodes is not None else float("inf")) - 1
+    for count in fanout:
+        next_level = []
+        for spec in level:
+            for i in range(1, min(count, remaining) + 1):
+                value = f"node{i}" if spec is root else f"{spec['value']}.{i}"
+                child = {"value": value, "children": []}
+                spec["children"].append(child)
+                next_level.append(child)
+            remaining -= len(spec["children"])
+        level = next_level
+    return root
+
+
+def generate_tree(fanout, max_nodes=None, deleted_ratio=0.0, seed=None):
+    """
+    The function `generate_tree` replaces the whole tree with a generated one, and soft deletes
+    random branches until about `deleted_ratio` of its nodes are deleted.
+
+    :param fanout: The `fanout` parameter is the number of children per node for every level
+    below the root
+    :param max_nodes: The `max_nodes` parameter stops the tree at that many nodes
+    :param deleted_ratio: The `deleted_ratio` parameter is the share of nodes to mark as deleted,
+    between 0 and 1. The root is never deleted
+    :param seed: The `seed` parameter makes the deleted branches the same from one run to the next
+    :return: a dict with the `root` id, and the number of `nodes` and `deleted` nodes
+    """
+    if not 0 <= deleted_ratio < 1:
+        raise ValidationError("`deleted_ratio` must be between 0 and 1.")
+
+    with transaction.atomic():
+        Tree.objects.delete_all()
+        [root] = Tree.objects.create_subtree([build_tree_specs(fanout, max_nodes)])
+        node_ids = list(
+            Tree.objects.exclude(pk=root["id"]).values_list("id", flat=True)
+        )
+
+        target = int((len(node_ids) + 1) * deleted_ratio)
+        deleted = 0
+        random.Random(seed).shuffle(node_ids)
+        for node_id in node_ids:
+            if deleted >= target:
+                break
+            node = Tree.objects.get(pk=node_id)
+            if not node.deleted:
+                deleted += Tree.objects.soft_delete(node)
+    return {"root": root["id"], "nodes": len(node_ids) + 1, "deleted": deleted}
+
+
+def purge_age(days, name="days"):
+    """
+    The function `purge_age` validates the number of days a node has to stay deleted before it is
+    purged, for the purge endpoint and command alike.
+
+    :param days: The `days` parameter is the number of days, an int or a float
+    :param name: The `name` parameter is the name of the parameter reported in the error
+    :return: the age as a `timedelta`. A `ValidationError` is raised if `days` is not a number between
+    0 and `MAX_PURGE_AFTER_DAYS`, NaN included.
+    """
+    if (
+        isinstance(days, bool)
+        or not isinstance(days, (int, float))
+        or not 0 <= days <= MAX_PURGE_AFTER_DAYS
+    ):
+        raise ValidationError(
+            f"`{name}` must be a number of days, between 0 and {MAX_PURGE_AFTER_DAYS}."
+        )
+    return timedelta(days=days)
+
+
+def purge_deleted(older_than, batch_size=None, max_batches=None):
+    """
+    The function `purge_deleted` hard deletes the nodes that were soft deleted more than `older_than`
+    ago, together with their deleted descendants, in batches of `batch_size` leaves with one short
+    transaction each, so it never holds long locks. See `TreeQuerySet.purge_batch`.
+
+    :param older_than: The `older_than` parameter is the `timedelta` a node has to stay deleted before
+    it is purged
+    :param batch_size: The `batch_size` parameter is the maximum number of nodes deleted per batch,
+    `TREE_API_PURGE_BATCH_SIZE` by default
+    :param max_batches: The `max_batches` parameter stops the purge after that many batches, None runs
+    until there is nothing left to purge
+    :return: a dict with the number of `purged` nodes, of `batches`, and whether the purge is `done`
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, "TREE_API_PURGE_BATCH_SIZE", 500)
+    deleted_before = timezone.now() - older_than
+
+    purged = batches = 0
+    done = False
+    while max_batches is None or batches < max_batches:
+        count = Tree.objects.purge_batch(deleted_before, batch_size)
+        if not count:
+            done = True
+            break
+        purged += count
+        batches += 1
+    return {"purged": purged, "batches": batches, "done": done}
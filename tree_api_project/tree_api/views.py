@@ -1,17 +1,69 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import transaction
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
-from django.http import JsonResponse
-
-from .models import Tree
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .cache import get_cached_subtree, peek_cached_subtree, subtree_cache_stats
+from .changelog import load_changes
+from .index import get_indexed_subtree, index_enabled
+from .middleware import timing
+from .models import SEARCH_MODES, Tree, TreeChange
+from .renderers import FLAT_FORMATS, SUBTREE_RENDERERS
 from .serializers import TreeSerializer
+from .utils import (
+    MAX_INTEGER,
+    build_tree_specs,
+    etag_matches,
+    flatten_subtree,
+    load_ancestors,
+    load_search_page,
+    load_subtree,
+    load_subtree_page,
+    parse_tree_shape,
+    purge_age,
+    purge_deleted,
+    query_flag,
+    query_int,
+    requested_format,
+    stream_subtree,
+    subtree_etag,
+    tree_json_response,
+)
+
+# Query parameters that select a representation the in-memory index does not serve.
+INDEX_BYPASS_PARAMS = {"max_depth", "children_limit", "after", "stream"}
+
+SEARCH_PAGE_SIZE = 50
+MAX_SEARCH_PAGE_SIZE = 200
+CHANGES_PAGE_SIZE = 100
+MAX_CHANGES_PAGE_SIZE = 1000
+# Batches purged per `purge-deleted` request, to keep the request short.
+PURGE_MAX_BATCHES = 10
 
 
 @api_view(["GET"])
+@renderer_classes(SUBTREE_RENDERERS)
 def get_subtree(request, node_id):
     """
-    The `get_subtree` function retrieves a subtree from a specified node in a tree structure.
+    The `get_subtree` function retrieves a subtree from a specified node in a tree structure. Subtrees are
+    served from the cache until one of their nodes changes, and the `X-Cache` header tells whether the
+    response was a cache HIT or MISS. Responses carry an `ETag` built from the node revision, and a
+    request whose `If-None-Match` matches it gets a 304 (NOT MODIFIED) without the subtree being loaded.
+    With `?stream=1`, or above `TREE_API_STREAM_THRESHOLD` descendants when the subtree is not cached, the
+    JSON is streamed from a database cursor instead of being built in memory. `?max_depth=` limits the
+    number of levels returned, and `?children_limit=` with `?after=<last child id>` pages through the
+    children of every node; nodes whose children were cut off carry `has_more` and `child_count`.
+    `?include_deleted=false` leaves out deleted nodes and their branches, which are pruned level by level
+    in the queries. `?format=flat`, or `Accept: application/vnd.tree.flat+json`, returns the subtree as
+    parallel arrays in pre-order, see `flatten_subtree`, and `?format=msgpack` returns the same arrays as
+    MessagePack when `msgpack` is installed. With `TREE_API_IN_MEMORY_INDEX`, full subtrees are served
+    from the in-memory tree index instead, see `get_subtree_from_index`.
     :param request: The `request` parameter represents the HTTP request object that contains information
     about the current request, such as headers, body, and user information
     :param node_id: The `node_id` parameter represents the unique identifier of the node that needs to
@@ -19,6 +71,140 @@ def get_subtree(request, node_id):
     :return: a JsonResponse object with a status code of 200 (OK) if the subtree is successfully retrieved.
     If the node does not exist, a JsonResponse object with a status code of 404 (NOT FOUND) is returned.
     """
+    if index_enabled() and not INDEX_BYPASS_PARAMS.intersection(request.GET):
+        return get_subtree_from_index(request, node_id)
+
+    try:
+        node = Tree.objects.get(pk=node_id)
+    except Tree.DoesNotExist:
+        return JsonResponse(
+            {"error": "Node not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    try:
+        max_depth = query_int(request, "max_depth")
+        children_limit = query_int(request, "children_limit", minimum=1)
+        after = query_int(request, "after")
+    except ValidationError as error:
+        return JsonResponse(
+            {"error": error.messages}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    include_deleted = query_flag(request, "include_deleted", default=True)
+    if node.deleted and not include_deleted:
+        return JsonResponse(
+            {"error": "Node not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    etag = subtree_etag(request, node.id, node.revision)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    if (
+        max_depth is not None
+        or children_limit is not None
+        or after is not None
+        or not include_deleted
+    ):
+        variant = f"{max_depth}.{children_limit}.{after}"
+        loader = partial(
+            load_subtree_page, node, max_depth, children_limit, after, include_deleted
+        )
+    else:
+        stream_threshold = getattr(settings, "TREE_API_STREAM_THRESHOLD", None)
+        if requested_format(request) not in FLAT_FORMATS:
+            stream = query_flag(request, "stream")
+            if not stream and stream_threshold is not None:
+                # Only a subtree missing from the cache is sized, and only up to the threshold.
+                subtree = peek_cached_subtree(node)
+                if subtree is not None:
+                    return subtree_response(request, subtree, etag, "HIT")
+                stream = Tree.objects.descendants_of(node)[stream_threshold:].exists()
+            if stream:
+                response = StreamingHttpResponse(
+                    stream_subtree(node), content_type="application/json"
+                )
+                response["ETag"] = etag
+                return response
+
+        variant = ""
+        loader = partial(load_subtree, node)
+
+    subtree, cached = get_cached_subtree(
+        node, loader, include_deleted=include_deleted, variant=variant
+    )
+
+    return subtree_response(request, subtree, etag, "HIT" if cached else "MISS")
+
+
+def get_subtree_from_index(request, node_id):
+    """
+    The `get_subtree_from_index` function answers `get_subtree` from the in-memory tree index, without
+    any query. The `ETag` is built from the generation of the index, and the `X-Cache` header is `INDEX`.
+    :param request: The `request` parameter represents the HTTP request object being answered
+    :param node_id: The `node_id` parameter represents the unique identifier of the node at the top of
+    the subtree
+    :return: a JsonResponse object with a status code of 200 (OK), or 404 (NOT FOUND) if the node does
+    not exist.
+    """
+    subtree, generation = get_indexed_subtree(
+        node_id, query_flag(request, "include_deleted", default=True)
+    )
+    if subtree is None:
+        return JsonResponse(
+            {"error": "Node not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    etag = subtree_etag(request, node_id, f"g{generation}")
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    return subtree_response(request, subtree, etag, "INDEX")
+
+
+def subtree_response(request, subtree, etag, cache_status):
+    """
+    The `subtree_response` function renders a subtree in the format negotiated for `request`: nested JSON
+    by default, or the parallel arrays of `flatten_subtree` for the flat and MessagePack formats.
+    :param request: The `request` parameter represents the HTTP request object being answered
+    :param subtree: The `subtree` parameter is the nested subtree to render
+    :param etag: The `etag` parameter is the ETag of the rendered representation
+    :param cache_status: The `cache_status` parameter is the value of the `X-Cache` header
+    :return: a response object with a status code of 200 (OK).
+    """
+    if requested_format(request) in FLAT_FORMATS:
+        # Timed by the renderers, which run after the view returns.
+        with timing("serialize"):
+            flat = flatten_subtree(subtree)
+        response = Response(flat, status=status.HTTP_200_OK)
+    else:
+        response = tree_json_response(subtree, status=status.HTTP_200_OK)
+    response["ETag"] = etag
+    response["X-Cache"] = cache_status
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+@api_view(["GET"])
+def get_ancestors(request, node_id):
+    """
+    The `get_ancestors` function returns the chain of nodes from the root of the tree down to the node
+    with the given `node_id`, such as the breadcrumb of a UI. The ancestors are read with a single
+    primary key lookup on the ids stored in the materialized path of the node, so the chain costs two
+    queries at any depth. With `?siblings=true`, every node of the chain also carries the other children
+    of its parent in a `siblings` list, read by the same query.
+    :param request: The `request` parameter represents the HTTP request object that contains information
+    about the current request, such as headers, body, and user information
+    :param node_id: The `node_id` parameter represents the unique identifier of the node at the bottom
+    of the chain
+    :return: a JsonResponse object with a status code of 200 (OK) and the chain in `ancestors`, the root
+    first and the node last. If the node does not exist, a JsonResponse object with a status code of 404
+    (NOT FOUND) is returned.
+    """
     try:
         node = Tree.objects.get(pk=node_id)
     except Tree.DoesNotExist:
@@ -26,21 +212,126 @@ def get_subtree(request, node_id):
             {"error": "Node not found"}, status=status.HTTP_404_NOT_FOUND
         )
 
-    def get_subtree_helper(node):
-        """
-        The function `get_subtree_helper` retrieves a subtree from a specified node in a tree structure.
+    chain = load_ancestors(node, siblings=query_flag(request, "siblings"))
+    return tree_json_response({"ancestors": chain}, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+def search_nodes(request):
+    """
+    The `search_nodes` function searches the nodes by value. `?q=` is the searched text and `?mode=` is
+    `exact`, `prefix`, or `contains` by default; exact and prefix matches are case sensitive lookups on
+    the index of `value`, substring matches are case insensitive and use the trigram index of `value` on
+    SQLite, see `TreeQuerySet.search`. `?under=<node id>` only searches the descendants of that node, and
+    `?include_deleted=false` leaves out deleted nodes. The results come in pages of `?limit=` nodes, in id
+    order, and `?after=` takes the `next` cursor of the previous page. Every result carries the chain of
+    its `ancestors` from the root, and a page costs at most three queries.
+    :param request: The `request` parameter represents the HTTP request object that contains information
+    about the current request, such as headers, body, and user information
+    :return: a JsonResponse object with a status code of 200 (OK), with the matching nodes in `results`
+    and the cursor of the next page in `next`. If a parameter is not valid, a JsonResponse object with
+    a status code of 400 (BAD REQUEST) is returned, and if the `under` node does not exist one with a
+    status code of 404 (NOT FOUND).
+    """
+    try:
+        nodes, under, limit, after = search_query(request)
+    except ValidationError as error:
+        return JsonResponse(
+            {"error": error.messages}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if under is not None:
+        try:
+            scope = Tree.objects.get(pk=under)
+        except Tree.DoesNotExist:
+            return JsonResponse(
+                {"error": "Node not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        nodes = nodes.descendants_of(scope)
+
+    page = load_search_page(nodes, limit, after)
+    return tree_json_response(page, status=status.HTTP_200_OK)
+
+
+def search_query(request):
+    """
+    The `search_query` function reads the parameters of `search_nodes`, without any query.
+    :param request: The `request` parameter represents the HTTP request object being answered
+    :return: a tuple with the queryset of the matching nodes, the id of the `under` node or None, the
+    size of the page and the `after` cursor. A `ValidationError` is raised if a parameter is not valid.
+    """
+    term = request.GET.get("q", "")
+    mode = request.GET.get("mode", "contains")
+    if not term:
+        raise ValidationError("`q` is required.")
+    if mode not in SEARCH_MODES:
+        raise ValidationError(f"`mode` must be one of {', '.join(SEARCH_MODES)}.")
+    under = query_int(request, "under")
+    limit = query_int(request, "limit", minimum=1) or SEARCH_PAGE_SIZE
+    after = query_int(request, "after")
+
+    nodes = Tree.objects.search(term, mode)
+    if not query_flag(request, "include_deleted", default=True):
+        nodes = nodes.filter(deleted=False)
+    return nodes, under, min(limit, MAX_SEARCH_PAGE_SIZE), after
+
+
+@api_view(["GET"])
+def get_changes(request):
+    """
+    The `get_changes` function returns the entries of the change log written after `?since=`, the cursor
+    returned by the previous call, so that clients mirroring the tree only fetch what changed. The log is
+    written in the transaction of every write while `TREE_API_CHANGE_LOG` is set. Every
+    write is one entry, whatever the number of nodes it touched: `create` and `update` carry the rows of
+    the written `nodes` as `[id, value, deleted, parent]`, `soft_delete` and `restore` carry the top
+    `node` and whether it was a `cascade`, `delete` a hard deleted `node`, and `clear` means the whole tree
+    was replaced. Without `?since=`, only the current cursor is returned, to be read before downloading
+    the tree. `?limit=` caps the number of entries, and `more` tells whether others follow them.
+    :param request: The `request` parameter represents the HTTP request object that contains information
+    about the current request, such as headers, body, and user information
+    :return: a JsonResponse object with a status code of 200 (OK), with the entries in `changes` and the
+    next `cursor`. If a parameter is not valid, a JsonResponse object with a status code of 400 (BAD
+    REQUEST) is returned, and if the entries after `since` were already pruned from the log, one with a
+    status code of 410 (GONE): the client has to download the tree again.
+    """
+    try:
+        since = query_int(request, "since")
+        limit = query_int(request, "limit", minimum=1) or CHANGES_PAGE_SIZE
+    except ValidationError as error:
+        return JsonResponse(
+            {"error": error.messages}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if since is None:
+        latest = TreeChange.objects.order_by("-id").values_list("id", flat=True)
+        return JsonResponse(
+            {"changes": [], "cursor": latest.first() or 0, "more": False},
+            status=status.HTTP_200_OK,
+        )
 
-        :param node: The "node" parameter represents a node in a tree structure
-        """
-        data = TreeSerializer(node).data
-        data["children"] = []
-        for child in node.children.all():
-            data["children"].append(get_subtree_helper(child))
-        return data
+    oldest = TreeChange.objects.order_by("id").values_list("id", flat=True).first()
+    if oldest is not None and since < oldest - 1:
+        return JsonResponse(
+            {"error": "Changes were pruned, the tree has to be downloaded again."},
+            status=status.HTTP_410_GONE,
+        )
+
+    changes, more = load_changes(since, min(limit, MAX_CHANGES_PAGE_SIZE))
+    cursor = changes[-1]["id"] if changes else since
+    return tree_json_response(
+        {"changes": changes, "cursor": cursor, "more": more}, status=status.HTTP_200_OK
+    )
 
-    subtree = get_subtree_helper(node)
 
-    return JsonResponse(subtree, status=status.HTTP_200_OK)
+@api_view(["GET"])
+def get_subtree_cache_stats(request):
+    """
+    The `get_subtree_cache_stats` function returns the hit and miss counters of the subtree cache.
+    :param request: The `request` parameter represents the HTTP request object that contains information
+    about the current request, such as headers, body, and user information
+    :return: a JsonResponse object with the `hits`, `misses` and `hit_rate` of the subtree cache.
+    """
+    return JsonResponse(subtree_cache_stats(), status=status.HTTP_200_OK)
 
 
 @api_view(["POST"])
@@ -93,56 +384,64 @@ def create_subnode(request, node_parent_id):
 
 
 @api_view(["POST"])
-@transaction.atomic
-def reset_tree(request):
-    """
-    The `reset_tree` function resets the tree to its default state, with 4 levels and 10 nodes.
-    :param request: The `request` parameter represents the HTTP request object that contains information
-    about the current request, such as headers, body, and user information
-    :return: a JsonResponse object with a status code of 200 (OK) if the tree is successfully reset.
+def add_subtree(request, node_parent_id):
     """
-    # Delete all nodes in the tree
-    Tree.objects.all().delete()
+    The `add_subtree` function receives a nested JSON document and inserts it as a new subtree under the
+    node with the given `node_parent_id`. The whole document is validated before anything is written and
+    the nodes are inserted with one `bulk_create` per level, in a single transaction.
 
-    # Create the root node
-    root_node = Tree.objects.create(value="root")
+    :param request: The `request` parameter is an object that represents the HTTP request made to the
+    server. Its body is a node such as `{"value": "a", "children": [{"value": "b"}]}`, or a list of them
+    :param node_parent_id: The `node_parent_id` parameter represents the unique identifier of the node
+    under which the new subtree needs to be created
+    :return: a Response object. If the document is valid, it returns the created ids in the same nested
+    structure as the input with a status code of 201 (HTTP_CREATED). If it is not valid, it returns the
+    list of errors with a status code of 400 (HTTP_BAD_REQUEST) and nothing is created. If the node with
+    the given `node_parent_id` does not exist, it returns a status code of 404 (NOT FOUND).
+    """
+    try:
+        parent_node = Tree.objects.get(pk=node_parent_id)
+    except Tree.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
 
-    # Create the first level of nodes
-    for i in range(1, 10):
-        node = Tree.objects.create(value=f"node{i}", parent=root_node)
+    specs = request.data if isinstance(request.data, list) else [request.data]
+    try:
+        created = Tree.objects.create_subtree(specs, parent=parent_node)
+    except ValidationError as error:
+        return Response({"error": error.messages}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Create the second level of nodes
-        for j in range(1, 4):
-            child_node = Tree.objects.create(value=f"node{i}.{j}", parent=node)
+    if not isinstance(request.data, list):
+        [created] = created
+    return Response(created, status=status.HTTP_201_CREATED)
 
-            # Create the third level of nodes
-            for k in range(1, 4):
-                grandchild_node = Tree.objects.create(
-                    value=f"node{i}.{j}.{k}", parent=child_node
-                )
 
-                # Create the fourth level of nodes
-                for l in range(1, 4):
-                    great_grandchild_node = Tree.objects.create(
-                        value=f"node{i}.{j}.{k}.{l}", parent=grandchild_node
-                    )
-
-    node = Tree.objects.get(value="node1")
+@api_view(["POST"])
+@transaction.atomic
+def reset_tree(request):
+    """
+    The `reset_tree` function resets the tree to its default state, with 4 levels below the root. The
+    nodes are inserted with one `bulk_create` per level.
+    :param request: The `request` parameter represents the HTTP request object that contains information
+    about the current request, such as headers, body, and user information. Its data may hold a
+    `fanout` (a number, or a list with one number per level) and a `depth` to generate a different shape
+    :return: a JsonResponse object with a status code of 200 (OK) if the tree is successfully reset. If the
+    requested shape is not valid, a JsonResponse object with a status code of 400 (BAD REQUEST) is returned.
+    """
+    try:
+        fanout = parse_tree_shape(request.data)
+    except ValidationError as error:
+        return JsonResponse(
+            {"error": error.messages}, status=status.HTTP_400_BAD_REQUEST
+        )
 
-    def get_subtree_helper(node):
-        """
-        The function `get_subtree_helper` retrieves a subtree from a specified node in a tree structure.
+    # Delete all nodes in the tree
+    Tree.objects.delete_all()
 
-        :param node: The "node" parameter represents a node in a tree structure
-        """
-        data = TreeSerializer(node).data
-        data["children"] = []
-        for child in node.children.all():
-            data["children"].append(get_subtree_helper(child))
-        return data
+    [root] = Tree.objects.create_subtree([build_tree_specs(fanout)])
 
-    subtree = get_subtree_helper(node)
-    return JsonResponse(
+    reset_node_id = root["children"][0]["id"] if root["children"] else root["id"]
+    subtree = load_subtree(Tree.objects.get(pk=reset_node_id))
+    return tree_json_response(
         {"message": "Tree reset successfully", "reset_node": subtree},
         status=status.HTTP_200_OK,
     )
@@ -176,70 +475,138 @@ def change_node_value(request, node_id):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(["PUT"])
+def move_node(request, node_id):
+    """
+    The `move_node` function moves the node with the given `node_id`, with its whole subtree, under the
+    node given as `parent` in the request data, or to the top level when `parent` is null. It runs in a
+    single transaction and a bounded number of queries whatever the size of the subtree, see
+    `TreeQuerySet.move`.
+
+    :param request: The `request` parameter represents the HTTP request object that contains information
+    about the current request, such as headers, body, and user information. Its data holds the id of the
+    new `parent`
+    :param node_id: The `node_id` parameter represents the unique identifier of the node that needs to
+    be moved
+    :return: a Response object. If the node is moved, it returns the serialized node with a status code
+    of 200 (HTTP_OK). If `parent` is missing, would create a cycle or would exceed the children or depth
+    limits, it returns the errors with a status code of 400 (HTTP_BAD_REQUEST). If the node or the new
+    parent does not exist, it returns a status code of 404 (NOT FOUND).
+    """
+    parent_id = request.data.get("parent") if isinstance(request.data, dict) else None
+    if (
+        not isinstance(request.data, dict)
+        or "parent" not in request.data
+        or isinstance(parent_id, bool)
+        or not (
+            parent_id is None
+            or isinstance(parent_id, int)
+            and 0 <= parent_id <= MAX_INTEGER
+        )
+    ):
+        return Response(
+            {"error": ["`parent` must be a node id or null."]},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        node = Tree.objects.get(pk=node_id)
+        parent = Tree.objects.get(pk=parent_id) if parent_id is not None else None
+    except Tree.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        Tree.objects.move(node, parent)
+    except ValidationError as error:
+        return Response({"error": error.messages}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(TreeSerializer(node).data, status=status.HTTP_200_OK)
+
+
 @api_view(["PUT"])
 def restore_deleted_node(request, node_id):
     """
-    The `restore_deleted_node` function receives a request and restores a deleted node and all its subnodes
-    that belong to it. It returns a response with the restored data or any errors encountered.
+    The `restore_deleted_node` function receives a request and restores a deleted node, together with all
+    the subnodes that belong to it unless `?cascade=false` is given. Either way the restore is a single
+    UPDATE inside a transaction.
 
     :param request: The `request` parameter represents the HTTP request object that contains information
     about the current request, such as headers, body, and user information
     :param node_id: The `node_id` parameter represents the unique identifier of the node that needs to
     be restored
-    :return: a Response object. If the node with the given `node_id` and all its subnodes are successfully
-    restored, it returns a status code of 200 (HTTP_OK). If the node with the given `node_id` does not exist,
-    it returns a Response object with a status code of 404 (NOT FOUND).
+    :return: a Response object. If the node is successfully restored, it returns a status code of 200
+    (HTTP_OK) with the number of restored nodes in the `X-Affected-Nodes` header. If only the node is
+    restored and one of its ancestors is still deleted, it returns a status code of 409 (CONFLICT). If
+    the node with the given `node_id` does not exist, it returns a Response object with a status code of
+    404 (NOT FOUND).
     """
     try:
         node = Tree.objects.get(pk=node_id)
     except Tree.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-    def restore_node(node):
-        """
-        The function `restore_node` restores a node and all its subnodes that belong to it.
+    cascade = query_flag(request, "cascade", default=True)
+    try:
+        affected = Tree.objects.restore(node, cascade=cascade)
+    except ValidationError as error:
+        return Response({"error": error.messages}, status=status.HTTP_409_CONFLICT)
 
-        :param node: The "node" parameter represents a node in a tree structure
-        """
-        node.deleted = False
-        node.save()
-        for child in node.children.all():
-            restore_node(child)
+    return Response(status=status.HTTP_200_OK, headers={"X-Affected-Nodes": affected})
 
-    restore_node(node)
 
-    return Response(status=status.HTTP_200_OK)
+@api_view(["POST"])
+def purge_deleted_nodes(request):
+    """
+    The `purge_deleted_nodes` function hard deletes the nodes that were soft deleted more than
+    `older_than_days` days ago, `TREE_API_PURGE_AFTER_DAYS` by default, with their deleted descendants.
+    They are deleted from the leaves upward in small batches with one short transaction each, and at
+    most `PURGE_MAX_BATCHES` batches per request: the request is repeated while `done` is false. The
+    `purge_deleted` management command does the same without the limit, see `utils.purge_deleted`.
+    :param request: The `request` parameter represents the HTTP request object that contains information
+    about the current request, such as headers, body, and user information. Its data may hold the
+    `older_than_days` threshold
+    :return: a JsonResponse object with a status code of 200 (OK), with the number of `purged` nodes and
+    whether the purge is `done`. If the threshold is not valid, a JsonResponse object with a status code
+    of 400 (BAD REQUEST) is returned.
+    """
+    days = (
+        request.data.get(
+            "older_than_days", getattr(settings, "TREE_API_PURGE_AFTER_DAYS", 30)
+        )
+        if isinstance(request.data, dict)
+        else None
+    )
+    try:
+        older_than = purge_age(days, "older_than_days")
+    except ValidationError as error:
+        return JsonResponse(
+            {"error": error.messages}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    result = purge_deleted(older_than, max_batches=PURGE_MAX_BATCHES)
+    return JsonResponse(result, status=status.HTTP_200_OK)
 
 
 @api_view(["DELETE"])
 def delete_node(request, node_id):
     """
-    The `delete_node` function marks a node and all its children as deleted in a tree structure.
+    The `delete_node` function marks a node and all its children as deleted in a tree structure, with a
+    single UPDATE inside a transaction.
     :param request: The `request` parameter represents the HTTP request object that contains information
     about the current request, such as headers, body, and user information
     :param node_id: The `node_id` parameter represents the unique identifier of the node that needs to
     be deleted from the tree structure
     :return: a Response object with a status code of 204 (NO CONTENT) if the node is successfully marked
-    as deleted. If the node does not exist, a Response object with a status code of 404 (NOT FOUND) is
-    returned.
+    as deleted, with the number of newly deleted nodes in the `X-Affected-Nodes` header. If the node does
+    not exist, a Response object with a status code of 404 (NOT FOUND) is returned.
     """
     try:
         node = Tree.objects.get(pk=node_id)
     except Tree.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-    def mark_deleted(node):
-        """
-        The function `mark_deleted` marks a node as deleted and recursively marks all its children as
-        deleted.
-
-        :param node: The "node" parameter represents a node in a tree structure
-        """
-        node.deleted = True
-        node.save()
-        for child in node.children.all():
-            mark_deleted(child)
+    affected = Tree.objects.soft_delete(node)
 
-    mark_deleted(node)
-
-    return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(
+        status=status.HTTP_204_NO_CONTENT, headers={"X-Affected-Nodes": affected}
+    )
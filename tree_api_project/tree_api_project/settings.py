@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "tree_api.middleware.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -82,6 +83,68 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tree-api",
+        "TIMEOUT": 300,
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    }
+}
+
+# Cache alias and timeout, in seconds, of the cached subtree responses
+TREE_API_CACHE_ALIAS = "default"
+TREE_API_CACHE_TIMEOUT = 300
+
+# Subtrees with more descendants than this are streamed instead of built in memory,
+# None only streams on `?stream=1`
+TREE_API_STREAM_THRESHOLD = None
+
+# Keep a copy of the whole tree in the memory of every worker and serve subtrees from it.
+# Workers check the shared write counter at most once per interval, in seconds, and
+# rebuild their copy when another worker wrote to the tree
+TREE_API_IN_MEMORY_INDEX = False
+TREE_API_INDEX_CHECK_INTERVAL = 1.0
+
+# Encode subtree responses with `orjson` when it is installed. Its output is compact JSON,
+# without the spaces the default encoder writes after `,` and `:`
+TREE_API_FAST_JSON = False
+
+# Measure the query count, database time, serialization time and response size of every
+# request, sent as a `Server-Timing` header and logged to "tree_api.timing". Requests slower
+# than the budget, in milliseconds, also log their slowest queries
+TREE_API_TIMING = False
+TREE_API_TIMING_BUDGET_MS = 500
+TREE_API_TIMING_SLOW_QUERIES = 5
+
+# Write the timing lines to the console, one JSON object per line. Without a handler only the
+# slow query warnings would be shown
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "message": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "timing": {
+            "class": "logging.StreamHandler",
+            "formatter": "message",
+            "level": "INFO",
+        },
+    },
+    "loggers": {
+        "tree_api.timing": {
+            "handlers": ["timing"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -122,3 +185,17 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Keep an ancestor/descendant closure table next to the materialized paths and read subtrees
+# from it. Run `manage.py rebuild_closure` after turning it on for an existing tree
+TREE_API_CLOSURE_TABLE = False
+
+# Log every write to the tree, with one more INSERT each, for the `changes` feed. Only the
+# last entries are kept: clients whose cursor is older have to download the tree again
+TREE_API_CHANGE_LOG = False
+TREE_API_CHANGE_LOG_RETENTION = 10_000
+
+# Soft deleted nodes are hard deleted by `manage.py purge_deleted` and `purge-deleted/` after
+# this many days, at most this many nodes per transaction
+TREE_API_PURGE_AFTER_DAYS = 30
+TREE_API_PURGE_BATCH_SIZE = 500
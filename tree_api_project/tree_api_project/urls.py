@@ -19,5 +19,6 @@ from django.urls import path, include
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/async/", include("tree_api.async_urls")),
     path("api/", include("tree_api.urls")),
 ]